@@ -0,0 +1,83 @@
+"""
+Shows that GET /tweets/by/{user_guid} costs the same however many tweets the table holds.
+Grows the tweets table step by step and times the first and a deep page of one author's timeline.
+Needs a migrated scratch database configured like the app (TESTING_TEMPLATE_DB_*), rows are added to it:
+    python -m benchmarks.author_timeline
+"""
+import asyncio
+import datetime
+import random
+import statistics
+import time
+import uuid
+
+from sqlalchemy import text
+
+from src.repo import bulk as bulk_repo
+from src.repo import tweet as tweet_repo
+from utils.db_connection import AsyncMainSession
+
+AUTHORS = 100
+TABLE_SIZES = (10_000, 100_000, 1_000_000)
+COPY_BATCH_SIZE = 50_000
+REPEAT = 50
+PAGE_SIZE = 20
+DEEP_PAGE = 50
+
+
+async def add_authors(async_session) -> list[uuid.UUID]:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    guids = [uuid.uuid4() for _ in range(AUTHORS)]
+    await bulk_repo.copy_users(async_session, [(guid, f'timeline-{guid}@email.com', 'Author', None, None,
+                                                True, True, ['reader'], now) for guid in guids])
+    await async_session.commit()
+    return guids
+
+
+async def add_tweets(async_session, authors: list[uuid.UUID], count: int):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for start in range(0, count, COPY_BATCH_SIZE):
+        records = [(uuid.uuid4(), 'lorem ipsum', random.choice(authors),
+                    now - datetime.timedelta(seconds=random.randint(0, 365 * 24 * 3600)), False)
+                   for _ in range(min(COPY_BATCH_SIZE, count - start))]
+        await bulk_repo.copy_tweets(async_session, records)
+        await async_session.commit()
+    await async_session.execute(text('ANALYZE tweets'))
+    await async_session.commit()
+
+
+async def time_page(async_session, author: uuid.UUID, depth: int) -> float:
+    """
+    Seconds spent on page number `depth` of the author's timeline, following cursors to reach it
+    """
+    after = None
+    for _ in range(depth - 1):
+        tweets = await tweet_repo.get_tweets(async_session, page=None, limit=PAGE_SIZE, after=after,
+                                             created_by_guid=author)
+        if not tweets:
+            break
+        after = (tweets[-1].created_at, tweets[-1].guid)
+    started = time.perf_counter()
+    await tweet_repo.get_tweets(async_session, page=None, limit=PAGE_SIZE, after=after, created_by_guid=author)
+    return time.perf_counter() - started
+
+
+async def main():
+    async with AsyncMainSession() as async_session:
+        authors = await add_authors(async_session)
+        total = 0
+        for size in TABLE_SIZES:
+            await add_tweets(async_session, authors, size - total)
+            total = size
+            for depth in (1, DEEP_PAGE):
+                timings = sorted([await time_page(async_session, random.choice(authors), depth)
+                                  for _ in range(REPEAT)])
+                print(f'{total:>9} tweets  page {depth:>3}  '
+                      f'p50 {statistics.median(timings) * 1e3:7.2f} ms  '
+                      f'p95 {timings[int(len(timings) * 0.95)] * 1e3:7.2f} ms')
+                # Loaded tweets stay in the identity map otherwise
+                async_session.expunge_all()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""
+Compares payload size and encode time of the full and the compact (format=compact) feed page.
+Runs on in-memory objects with guids of the asyncpg UUID type, no database required:
+    python -m benchmarks.feed_format
+"""
+import datetime
+import json
+import random
+import timeit
+import uuid
+
+import orjson
+from asyncpg.pgproto.pgproto import UUID as PgUUID
+from fastapi.encoders import jsonable_encoder
+
+from src import db_models
+from src.service.tweets import get_compact_feed, with_photo_size
+
+NUMBER = 2000
+PAGE_SIZE = 20
+AUTHORS = 3
+
+
+def make_guid() -> PgUUID:
+    # The type asyncpg loads uuid columns as
+    return PgUUID(str(uuid.uuid4()))
+
+
+def make_page() -> list[db_models.Tweet]:
+    authors = [db_models.User(guid=make_guid(),
+                              email=f'author{i}@email.com',
+                              first_name=f'Author{i}',
+                              last_name='Doe',
+                              roles=['reader'],
+                              photo_url=f'https://s3.example.com/bucket/public/photos/{i}/original',
+                              photo_urls={'64': f'https://s3.example.com/{i}_64.webp',
+                                          '256': f'https://s3.example.com/{i}_256.webp'},
+                              is_verified=True)
+               for i in range(AUTHORS)]
+    now = datetime.datetime.now(datetime.timezone.utc)
+    tweets = []
+    for i in range(PAGE_SIZE):
+        author = random.choice(authors)
+        tweets.append(db_models.Tweet(guid=make_guid(),
+                                      message=f'Tweet number {i} ' + 'lorem ipsum ' * random.randint(1, 10),
+                                      created_by_guid=author.guid,
+                                      created_by=author,
+                                      created_at=now - datetime.timedelta(minutes=i)))
+    return tweets
+
+
+def main():
+    tweets = make_page()
+
+    def encode_full():
+        return json.dumps(jsonable_encoder(with_photo_size(tweets, None))).encode()
+
+    def encode_compact():
+        return orjson.dumps(get_compact_feed(tweets, None, None), default=str)
+
+    for name, encode in (('full', encode_full), ('compact', encode_compact)):
+        size = len(encode())
+        seconds = timeit.timeit(encode, number=NUMBER)
+        print(f'{name:8} {size:6} bytes {seconds / NUMBER * 1e6:9.1f} us/page')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Python overhead per user_repo.get_user call: building the statement and its cache key,
+which SQLAlchemy does on every execute before looking the compiled SQL up.
+Compares select() built on every call with the lambda statements user_repo uses. No database required:
+    python -m benchmarks.get_user_overhead
+With --db also times whole get_user calls against the database configured like the app (TESTING_TEMPLATE_DB_*).
+"""
+import argparse
+import asyncio
+import time
+import timeit
+import uuid
+
+from sqlalchemy import select, lambda_stmt
+
+from src import db_models
+from src.repo import user as user_repo
+from utils.db_connection import AsyncMainSession, DB_COMPILED_CACHE
+
+NUMBER = 20000
+
+
+def select_by_email(email):
+    return select(db_models.User).where(db_models.User.email == email).limit(1)
+
+
+def lambda_by_email(email):
+    return lambda_stmt(lambda: select(db_models.User).where(db_models.User.email == email).limit(1))
+
+
+def select_by_guid(user_guid):
+    return select(db_models.User).where(db_models.User.guid == user_guid).limit(1)
+
+
+def lambda_by_guid(user_guid):
+    return lambda_stmt(lambda: select(db_models.User).where(db_models.User.guid == user_guid).limit(1))
+
+
+def select_by_tg_id(tg_id):
+    return select(db_models.User).where(db_models.User.tg_id == tg_id).limit(1)
+
+
+def lambda_by_tg_id(tg_id):
+    return lambda_stmt(lambda: select(db_models.User).where(db_models.User.tg_id == tg_id).limit(1))
+
+
+CASES = (
+    ('email', select_by_email, lambda_by_email, lambda: f'{uuid.uuid4()}@email.com'),
+    ('guid', select_by_guid, lambda_by_guid, uuid.uuid4),
+    ('tg_id', select_by_tg_id, lambda_by_tg_id, lambda: str(uuid.uuid4().int)[:10]),
+)
+
+
+def measure_statements():
+    for name, make_select, make_lambda, make_value in CASES:
+        value = make_value()
+        for kind, make_statement in (('select', make_select), ('lambda', make_lambda)):
+            seconds = timeit.timeit(lambda: make_statement(value)._generate_cache_key(), number=NUMBER)
+            print(f'{name:6} {kind:7} {seconds / NUMBER * 1e6:7.1f} us/call')
+
+
+async def measure_calls():
+    async with AsyncMainSession() as async_session:
+        for name, _, _, make_value in CASES:
+            values = [make_value() for _ in range(1000)]
+            started = time.perf_counter()
+            for value in values:
+                await user_repo.get_user(async_session, **{{'guid': 'user_guid'}.get(name, name): value})
+            print(f'get_user by {name:6} {(time.perf_counter() - started) / len(values) * 1e6:7.1f} us/call')
+    for sample in DB_COMPILED_CACHE.collect()[0].samples:
+        if sample.name.endswith('_total'):
+            print(f"compiled cache {sample.labels['result']:8} {int(sample.value)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', action='store_true', help='Also time get_user against the database')
+    args = parser.parse_args()
+    measure_statements()
+    if args.db:
+        asyncio.run(measure_calls())
@@ -0,0 +1,42 @@
+"""
+Compares the cost of verifying an access token on every request with the cached path of src.auth.decode_token.
+Run from the repository root:
+    python -m benchmarks.jwt_decode
+"""
+import timeit
+from datetime import timedelta
+
+from jose import jwt
+
+from conf import settings
+from conf.secrets import PASSWORD_ENCODING_SECRET
+from src.auth import decode_token, jwt_cache
+from src.service.auth import create_jwt_token
+
+NUMBER = 20000
+
+
+def main():
+    token = create_jwt_token(data={
+        "sub": "5f0c7b8e-5d6a-4c47-9d44-5b6b9a4f0e11",
+        "first_name": "John",
+        "last_name": "Doe",
+        "email": "john@email.com",
+        "roles": ["reader"],
+        "photo_url": None,
+    }, expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
+
+    uncached = timeit.timeit(lambda: jwt.decode(token, PASSWORD_ENCODING_SECRET, algorithms=[settings.ALGORITHM]),
+                             number=NUMBER)
+    jwt_cache.clear()
+    decode_token(token)
+    cached = timeit.timeit(lambda: decode_token(token), number=NUMBER)
+
+    print(f'jose.jwt.decode:       {uncached / NUMBER * 1e6:8.2f} us/request')
+    print(f'decode_token (cached): {cached / NUMBER * 1e6:8.2f} us/request')
+    print(f'saved:                 {(uncached - cached) / NUMBER * 1e6:8.2f} us/request '
+          f'({uncached / cached:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
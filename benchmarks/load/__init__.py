@@ -0,0 +1,8 @@
+"""
+HTTP load test of main:app: boots uvicorn against the database configured like the app (TESTING_TEMPLATE_DB_*),
+registers virtual users and drives login, feed paging, posting and admin search at a given concurrency.
+Prints RPS and p50/p95/p99 per endpoint, saves them as JSON and compares them to a baseline:
+    python -m benchmarks.load --concurrency 50 --duration 60 --output load.json --baseline benchmarks/load/baseline.json
+A run with --save-baseline makes its results the new baseline.
+Outside of prod mode the app echoes every SQL statement, which shows in the numbers, compare like with like.
+"""
@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.load import __doc__ as usage
+from benchmarks.load.report import summarize, print_report, compare
+from benchmarks.load.scenarios import ENDPOINTS, SCENARIOS, create_users
+from benchmarks.load.server import run_server, run_migrations, get_server_env
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(','):
+        name, weight = part.split('=')
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f'Unknown scenario {name}, choose from {", ".join(SCENARIOS)}')
+        mix[name] = float(weight)
+    return mix
+
+
+async def run_load(base_url: str, args) -> dict:
+    samples: dict[str, list[tuple[float, bool]]] = defaultdict(list)
+    names, weights = list(args.mix), list(args.mix.values())
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        users = await create_users(client, args.users, args.superusers)
+        superusers = users[:args.superusers]
+
+        async def worker(index: int, deadline: float, is_recorded: bool):
+            user = users[index % len(users)]
+            while time.monotonic() < deadline:
+                name = random.choices(names, weights)[0]
+                actor = random.choice(superusers) if name == 'search' else user
+                started = time.perf_counter()
+                try:
+                    endpoint, response = await SCENARIOS[name](client, actor)
+                    is_error = response.status_code >= 400
+                except httpx.HTTPError:
+                    endpoint, is_error = ENDPOINTS[name], True
+                if is_recorded:
+                    samples[endpoint].append((time.perf_counter() - started, is_error))
+
+        for duration, is_recorded in ((args.warmup, False), (args.duration, True)):
+            deadline = time.monotonic() + duration
+            await asyncio.gather(*[worker(i, deadline, is_recorded) for i in range(args.concurrency)])
+    return summarize(samples, args.duration)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.load', description=usage,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='Load an already running app instead of booting one')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--migrate', action='store_true', help='Run alembic upgrade head first')
+    parser.add_argument('--keep-rate-limits', action='store_true')
+    parser.add_argument('--concurrency', type=int, default=20, help='Requests in flight at once')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds measured')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds of load before measuring')
+    parser.add_argument('--timeout', type=float, default=30, help='Seconds per request')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--superusers', type=int, default=2)
+    parser.add_argument('--mix', type=parse_mix, default='feed=6,post=2,login=1,search=1',
+                        help='Relative weights of the scenarios')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='JSON file to save the results to')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results to --baseline')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed regression, 0.1 is 10%%')
+    args = parser.parse_args()
+    if args.save_baseline and not args.baseline:
+        parser.error('--save-baseline requires --baseline')
+    if isinstance(args.mix, str):
+        args.mix = parse_mix(args.mix)
+    random.seed(args.seed)
+
+    env = get_server_env(args.keep_rate_limits)
+    if args.migrate:
+        run_migrations(env)
+    server = contextlib.nullcontext(args.base_url) if args.base_url else run_server(args.port, args.workers, env)
+    with server as base_url:
+        endpoints = asyncio.run(run_load(base_url, args))
+
+    print_report(endpoints)
+    results = {
+        'finished_at': datetime.now(timezone.utc).isoformat(),
+        'config': {'concurrency': args.concurrency, 'duration': args.duration, 'workers': args.workers,
+                   'users': args.users, 'mix': args.mix, 'seed': args.seed},
+        'endpoints': endpoints,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2)
+    elif args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline['config'] != results['config']:
+            print(f"Baseline was made with {baseline['config']}, the comparison may not be meaningful")
+        regressions = compare(endpoints, baseline['endpoints'], args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
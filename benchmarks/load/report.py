@@ -0,0 +1,52 @@
+import math
+
+
+def get_percentile(sorted_values: list[float], percent: float) -> float:
+    if not sorted_values:
+        return 0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples: dict[str, list[tuple[float, bool]]], seconds: float) -> dict:
+    """
+    :param samples: endpoint -> (latency in seconds, whether the response was an error) of every request
+    """
+    endpoints = {}
+    for endpoint, endpoint_samples in sorted(samples.items()):
+        latencies = sorted(latency for latency, _ in endpoint_samples)
+        endpoints[endpoint] = {
+            'requests': len(endpoint_samples),
+            'errors': sum(is_error for _, is_error in endpoint_samples),
+            'rps': round(len(endpoint_samples) / seconds, 2),
+            'p50_ms': round(get_percentile(latencies, 50) * 1e3, 2),
+            'p95_ms': round(get_percentile(latencies, 95) * 1e3, 2),
+            'p99_ms': round(get_percentile(latencies, 99) * 1e3, 2),
+        }
+    return endpoints
+
+
+def print_report(endpoints: dict):
+    print(f"{'endpoint':28} {'requests':>9} {'errors':>7} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, stats in endpoints.items():
+        print(f"{endpoint:28} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>9.1f} "
+              f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+
+
+def compare(endpoints: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    :return: regressions, latency percentiles or rps worse than the baseline by more than tolerance (0.1 is 10%)
+    """
+    regressions = []
+    for endpoint, stats in endpoints.items():
+        base = baseline.get(endpoint)
+        if base is None:
+            continue
+        for percentile in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if stats[percentile] > base[percentile] * (1 + tolerance):
+                regressions.append(f'{endpoint} {percentile} {stats[percentile]} > {base[percentile]} in baseline')
+        if stats['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f"{endpoint} rps {stats['rps']} < {base['rps']} in baseline")
+        if stats['errors'] / stats['requests'] > base['errors'] / max(base['requests'], 1) + 0.01:
+            regressions.append(f"{endpoint} errors {stats['errors']} of {stats['requests']} requests")
+    return regressions
@@ -0,0 +1,92 @@
+import random
+import uuid
+
+import httpx
+from sqlalchemy import update
+
+from src import db_models
+from src.repo import user as user_repo
+from src.roles import Role
+from utils.db_connection import AsyncMainSession
+
+PASSWORD = 'load_test_password'
+SEARCHES = ('load', 'user', 'ann', 'bob', 'example')
+
+
+class VirtualUser:
+    def __init__(self, email: str, headers: dict[str, str]):
+        self.email = email
+        self.headers = headers
+        self.cursor = ''
+
+
+async def create_users(client: httpx.AsyncClient, count: int, superusers: int) -> list[VirtualUser]:
+    """
+    Registers users over HTTP, verifies them and makes the first `superusers` of them admins in the database,
+    then logs them in
+    """
+    run = uuid.uuid4().hex[:8]
+    emails = [f'load-{run}-{i}@example.com' for i in range(count)]
+    for email in emails:
+        register_resp = await client.post('/auth/register', json={'email': email, 'password': PASSWORD,
+                                                                  'first_name': random.choice(SEARCHES)})
+        register_resp.raise_for_status()
+    async with AsyncMainSession() as async_session:
+        for email in emails:
+            user = await user_repo.get_user(async_session, email=email)
+            await user_repo.verify_user(async_session, user.guid)
+        await async_session.execute(update(db_models.User).where(db_models.User.email.in_(emails[:superusers]))
+                                    .values(roles=[Role.Admin.value]))
+        await async_session.commit()
+    users = []
+    for email in emails:
+        login_resp = await client.post('/auth/login/email', data={'username': email, 'password': PASSWORD})
+        login_resp.raise_for_status()
+        users.append(VirtualUser(email, {'Authorization': 'Bearer ' + login_resp.json()['access_token']}))
+    return users
+
+
+# Endpoint name each scenario is reported under, its failed requests (timeouts, refused connections) included
+ENDPOINTS = {
+    'login': 'POST /auth/login/email',
+    'feed': 'GET /tweets',
+    'post': 'POST /tweets/new',
+    'search': 'GET /superuser/users',
+}
+
+# Each scenario makes one request and returns its endpoint name and the response
+
+
+async def login(client: httpx.AsyncClient, user: VirtualUser):
+    return ENDPOINTS['login'], await client.post('/auth/login/email', data={'username': user.email,
+                                                                            'password': PASSWORD})
+
+
+async def feed(client: httpx.AsyncClient, user: VirtualUser):
+    """
+    Pages through the feed with cursors, starting over after the 5th page or the end
+    """
+    feed_resp = await client.get('/tweets', params={'cursor': user.cursor, 'limit': 20})
+    if feed_resp.status_code == 200:
+        user.cursor = feed_resp.json()['next_cursor'] or ''
+        if random.random() < 0.2:
+            user.cursor = ''
+    return ENDPOINTS['feed'], feed_resp
+
+
+async def post_tweet(client: httpx.AsyncClient, user: VirtualUser):
+    return ENDPOINTS['post'], await client.post('/tweets/new', headers=user.headers,
+                                                json={'message': f'load test {uuid.uuid4()}'})
+
+
+async def admin_search(client: httpx.AsyncClient, user: VirtualUser):
+    return ENDPOINTS['search'], await client.get('/superuser/users', headers=user.headers,
+                                                 params={'search': random.choice(SEARCHES), 'limit': 20})
+
+
+SCENARIOS = {
+    'login': login,
+    'feed': feed,
+    'post': post_tweet,
+    'search': admin_search,
+}
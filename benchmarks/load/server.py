@@ -0,0 +1,51 @@
+import contextlib
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def run_migrations(env: dict[str, str]):
+    subprocess.run([sys.executable, '-m', 'alembic', 'upgrade', 'head'], env=env, check=True)
+
+
+@contextlib.contextmanager
+def run_server(port: int, workers: int, env: dict[str, str], timeout: float = 30):
+    """
+    Runs uvicorn with main:app until the block exits
+    :return: base url of the app
+    """
+    process = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port),
+                                '--workers', str(workers), '--log-level', 'warning'],
+                               env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f'uvicorn exited with {process.returncode}')
+            try:
+                if httpx.get(f'{base_url}/ping').status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'App did not start in {timeout}s')
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def get_server_env(keep_rate_limits: bool) -> dict[str, str]:
+    env = dict(os.environ)
+    if not keep_rate_limits:
+        # Every virtual user comes from the same address
+        env['TESTING_TEMPLATE_IS_RATE_LIMIT_ENABLED'] = '0'
+    return env
@@ -0,0 +1,210 @@
+"""
+Seeds the database with synthetic users and tweets for scale testing, straight through COPY.
+The data depends only on the seed: tweet authors follow a power law, posting times come in bursts,
+a share of users is unverified and a share of tweets is soft-deleted.
+Needs a migrated database configured like the app (TESTING_TEMPLATE_DB_*), rows are added to it:
+    python -m benchmarks.seed_data --users 1000000 --tweets 10000000 --seed 1
+Users get the password `password`. Seeding again with the same seed conflicts with the rows already there.
+Also used by the scale tests (TEST_SCALE_USERS) through a fixture.
+"""
+import argparse
+import asyncio
+import datetime
+import hashlib
+import math
+import random
+import time
+import uuid
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src import partitions
+from src.passwords import hash_password_sync
+from src.repo import bulk as bulk_repo
+from src.repo import counter as counter_repo
+from src.roles import Role
+
+FIRST_NAMES = ('Ann', 'Bob', 'Carol', 'Dave', 'Eve', 'Frank', 'Grace', 'Heidi', 'Ivan', 'Judy', 'Mallory', 'Oscar',
+               'Peggy', 'Rupert', 'Sybil', 'Trent', 'Victor', 'Walter', 'Olga', 'Nikolay')
+LAST_NAMES = ('Smith', 'Johnson', 'Brown', 'Garcia', 'Miller', 'Davis', 'Ivanov', 'Petrov', 'Muller', 'Rossi',
+              'Tanaka', 'Kim', 'Nguyen', 'Silva', 'Novak', 'Dubois')
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do', 'eiusmod',
+         'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua', 'release', 'python', 'postgres',
+         'weekend', 'coffee', 'deploy', 'bug', 'feature', 'today', 'news', 'match')
+
+
+class SeedConfig:
+    """
+    :param author_exponent: Zipf exponent of tweets per author, the author ranked k writes about 1 / k ** exponent
+    as many tweets as the most active one. Higher means fewer authors write more of the tweets
+    :param burst_share: share of tweets posted during one of the bursts, the rest is spread evenly
+    """
+
+    def __init__(self, users: int, tweets: int, seed: int = 0, days: int = 365, batch_size: int = 50_000,
+                 workers: int = 4, unverified_share: float = 0.1, deleted_share: float = 0.05,
+                 author_exponent: float = 1.0, bursts: int = 200, burst_share: float = 0.4,
+                 burst_minutes: float = 30, now: datetime.datetime | None = None):
+        self.users = users
+        self.tweets = tweets
+        self.seed = seed
+        self.days = days
+        self.batch_size = batch_size
+        self.workers = workers
+        self.unverified_share = unverified_share
+        self.deleted_share = deleted_share
+        self.author_exponent = author_exponent
+        self.bursts = bursts
+        self.burst_share = burst_share
+        self.burst_minutes = burst_minutes
+        # Fixed by default, so the same seed gives the same rows whenever it runs
+        self.now = now or datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        self.start = self.now - datetime.timedelta(days=days)
+
+
+def get_user_guid(seed: int, number: int) -> uuid.UUID:
+    return uuid.UUID(bytes=hashlib.md5(f'{seed}:user:{number}'.encode()).digest(), version=4)
+
+
+def get_rng(config: SeedConfig, kind: str, batch: int) -> random.Random:
+    # Every batch has its own generator, so batches give the same rows in whatever order they run
+    return random.Random(f'{config.seed}:{kind}:{batch}')
+
+
+def make_user_records(config: SeedConfig, batch: int, password_hash: str) -> list[tuple]:
+    rng = get_rng(config, 'users', batch)
+    period = (config.now - config.start).total_seconds()
+    records = []
+    for number in range(batch * config.batch_size, min((batch + 1) * config.batch_size, config.users)):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        records.append((get_user_guid(config.seed, number),
+                        f'{first_name}.{last_name}.{number}@example.com'.lower(),
+                        first_name,
+                        last_name,
+                        password_hash,
+                        rng.random() >= config.unverified_share,
+                        True,
+                        [Role.Reader.value],
+                        config.start + datetime.timedelta(seconds=rng.random() * period)))
+    return records
+
+
+def get_bursts(config: SeedConfig) -> list[datetime.datetime]:
+    rng = get_rng(config, 'bursts', 0)
+    period = (config.now - config.start).total_seconds()
+    return [config.start + datetime.timedelta(seconds=rng.random() * period) for _ in range(config.bursts)]
+
+
+def get_author_rank(rng: random.Random, users: int, exponent: float) -> int:
+    """
+    Draws the rank (0 is the most active) of a tweet's author from a Zipf distribution bounded to `users` ranks,
+    by inverting the CDF of its continuous counterpart on [1, users + 1)
+    """
+    if exponent == 1:
+        rank = (users + 1) ** rng.random()
+    else:
+        rank = (1 + rng.random() * ((users + 1) ** (1 - exponent) - 1)) ** (1 / (1 - exponent))
+    return min(int(rank) - 1, users - 1)
+
+
+def get_author_permutation(config: SeedConfig) -> tuple[int, int]:
+    """
+    Seeded (a, b) mapping author rank to user number as (a * rank + b) % users, a permutation since a and users
+    are coprime, so the most active authors are spread over the users rather than being the first ones
+    """
+    rng = get_rng(config, 'authors', 0)
+    while math.gcd(a := rng.randrange(1, max(2, config.users)), config.users) != 1:
+        pass
+    return a, rng.randrange(config.users)
+
+
+def make_tweet_records(config: SeedConfig, batch: int, bursts: list[datetime.datetime],
+                       author_permutation: tuple[int, int]) -> list[tuple]:
+    rng = get_rng(config, 'tweets', batch)
+    period = (config.now - config.start).total_seconds()
+    a, b = author_permutation
+    records = []
+    for _ in range(batch * config.batch_size, min((batch + 1) * config.batch_size, config.tweets)):
+        author = (a * get_author_rank(rng, config.users, config.author_exponent) + b) % config.users
+        if bursts and rng.random() < config.burst_share:
+            created_at = rng.choice(bursts) + datetime.timedelta(minutes=rng.gauss(0, config.burst_minutes))
+            created_at = min(max(created_at, config.start), config.now)
+        else:
+            created_at = config.start + datetime.timedelta(seconds=rng.random() * period)
+        records.append((uuid.UUID(int=rng.getrandbits(128), version=4),
+                        ' '.join(rng.choices(WORDS, k=rng.randint(3, 30))),
+                        get_user_guid(config.seed, author),
+                        created_at,
+                        rng.random() < config.deleted_share))
+    return records
+
+
+async def create_partitions(session_maker: async_sessionmaker, config: SeedConfig):
+    month = config.start.date().replace(day=1)
+    async with session_maker() as async_session:
+        while month <= config.now.date():
+            await partitions.create_partition(async_session, month)
+            month = partitions.add_months(month, 1)
+        await async_session.commit()
+
+
+async def copy_batches(session_maker: async_sessionmaker, config: SeedConfig, count: int, copy_batch):
+    """
+    Runs `copy_batch(async_session, batch)` for every batch, up to config.workers at once on their own connections
+    """
+    batches = iter(range(-(-count // config.batch_size)))
+
+    async def worker():
+        async with session_maker() as async_session:
+            for batch in batches:
+                await copy_batch(async_session, batch)
+                await async_session.commit()
+
+    await asyncio.gather(*[worker() for _ in range(config.workers)])
+
+
+async def seed(session_maker: async_sessionmaker, config: SeedConfig) -> dict:
+    """
+    Adds config.users users, then config.tweets tweets, keeping row_counters in step
+    :return: rows added and seconds spent
+    """
+    started = time.perf_counter()
+    password_hash = hash_password_sync('password')
+    bursts = get_bursts(config)
+    author_permutation = get_author_permutation(config)
+    await create_partitions(session_maker, config)
+
+    async def copy_users(async_session, batch: int):
+        records = make_user_records(config, batch, password_hash)
+        await bulk_repo.copy_users(async_session, records)
+        await counter_repo.increment(async_session, counter_repo.USERS, len(records))
+
+    async def copy_tweets(async_session, batch: int):
+        records = make_tweet_records(config, batch, bursts, author_permutation)
+        await bulk_repo.copy_tweets(async_session, records)
+        await counter_repo.increment(async_session, counter_repo.TWEETS,
+                                     sum(not is_deleted for *_, is_deleted in records))
+
+    await copy_batches(session_maker, config, config.users, copy_users)
+    await copy_batches(session_maker, config, config.tweets, copy_tweets)
+    async with session_maker() as async_session:
+        await async_session.execute(text('ANALYZE users'))
+        await async_session.execute(text('ANALYZE tweets'))
+        await async_session.commit()
+    return {'users': config.users, 'tweets': config.tweets, 'seconds': round(time.perf_counter() - started, 1)}
+
+
+if __name__ == '__main__':
+    from utils.db_connection import AsyncMainSession
+
+    parser = argparse.ArgumentParser(description='Synthetic users and tweets for scale testing')
+    parser.add_argument('--users', type=int, required=True)
+    parser.add_argument('--tweets', type=int, required=True)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--days', type=int, default=365, help='Tweets are spread over this many days')
+    parser.add_argument('--workers', type=int, default=4, help='Batches copied at once')
+    parser.add_argument('--batch-size', type=int, default=50_000)
+    args = parser.parse_args()
+    print(asyncio.run(seed(AsyncMainSession, SeedConfig(users=args.users, tweets=args.tweets, seed=args.seed,
+                                                        days=args.days, workers=args.workers,
+                                                        batch_size=args.batch_size))))
@@ -0,0 +1,111 @@
+"""
+Round trips and latency of the user write paths, the previous select-then-write versions
+against the insert-first ones of repo.user. Password hashing is left out.
+A telegram login of an existing user takes the insert and then a select, both writing nothing.
+Needs a migrated scratch database configured like the app (TESTING_TEMPLATE_DB_*), users are added to it:
+    python -m benchmarks.write_round_trips
+"""
+import asyncio
+import statistics
+import time
+import uuid
+
+from sqlalchemy import event, select
+
+from src import db_models
+from src.repo import user as user_repo
+from src.roles import Role
+from utils.db_connection import AsyncMainSession, async_engine
+
+REPEAT = 200
+PASSWORD_HASH = '$2b$12$' + 'x' * 53
+
+round_trips = 0
+
+
+def count_round_trip(*args, **kwargs):
+    global round_trips
+    round_trips += 1
+
+
+async def register_before(async_session):
+    email = f'{uuid.uuid4()}@bench.com'
+    exists_resp = await async_session.execute(select(db_models.User).filter_by(email=email).limit(1))
+    assert exists_resp.scalars().first() is None
+    user = db_models.User(guid=uuid.uuid4(), email=email, password=PASSWORD_HASH, is_verified=False,
+                          is_active=True, roles=[Role.Reader.value])
+    await user_repo.new_user(async_session, user)
+    await async_session.commit()
+
+
+async def register_after(async_session):
+    await user_repo.insert_user(async_session, guid=uuid.uuid4(), email=f'{uuid.uuid4()}@bench.com',
+                                password=PASSWORD_HASH, is_verified=False, is_active=True, roles=[Role.Reader.value])
+    await async_session.commit()
+
+
+async def tg_login_before(async_session, tg_id):
+    user = await user_repo.get_user(async_session, tg_id=tg_id)
+    if user is None:
+        user = db_models.User(tg_id=tg_id, is_active=True, roles=[Role.Reader.value], is_verified=True)
+        await user_repo.new_user(async_session, user)
+        await async_session.commit()
+        await async_session.refresh(user)
+    return user.guid
+
+
+async def tg_login_after(async_session, tg_id):
+    user, _ = await user_repo.upsert_tg_user(async_session, tg_id=tg_id, is_active=True,
+                                             roles=[Role.Reader.value], is_verified=True)
+    guid = user.guid
+    await async_session.commit()
+    return guid
+
+
+async def verify_before(async_session, guid):
+    user_resp = await async_session.execute(select(db_models.User).filter_by(guid=guid).limit(1))
+    user_resp.scalars().one().is_verified = True
+    await async_session.commit()
+
+
+async def verify_after(async_session, guid):
+    await user_repo.verify_user(async_session, guid)
+    await async_session.commit()
+
+
+async def measure(name: str, call) -> None:
+    global round_trips
+    timings = []
+    round_trips = 0
+    for i in range(REPEAT):
+        async with AsyncMainSession() as async_session:
+            started = time.perf_counter()
+            await call(async_session, i)
+            timings.append(time.perf_counter() - started)
+    timings.sort()
+    print(f'{name:24} {round_trips / REPEAT:5.1f} round trips  '
+          f'p50 {statistics.median(timings) * 1e3:6.2f} ms  p95 {timings[int(REPEAT * 0.95)] * 1e3:6.2f} ms')
+
+
+async def main():
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', count_round_trip)
+    event.listen(async_engine.sync_engine, 'commit', count_round_trip)
+    run = uuid.uuid4().hex[:8]
+    async with AsyncMainSession() as async_session:
+        guids = [await user_repo.insert_user(async_session, guid=uuid.uuid4(), email=f'{uuid.uuid4()}@bench.com',
+                                             is_verified=False, is_active=True)
+                 for _ in range(REPEAT)]
+        await async_session.commit()
+
+    await measure('register before', lambda session, i: register_before(session))
+    await measure('register after', lambda session, i: register_after(session))
+    await measure('tg new user before', lambda session, i: tg_login_before(session, f'{run}-before-{i}'))
+    await measure('tg new user after', lambda session, i: tg_login_after(session, f'{run}-after-{i}'))
+    await measure('tg existing before', lambda session, i: tg_login_before(session, f'{run}-before-{i}'))
+    await measure('tg existing after', lambda session, i: tg_login_after(session, f'{run}-after-{i}'))
+    await measure('verify before', lambda session, i: verify_before(session, guids[i]))
+    await measure('verify after', lambda session, i: verify_after(session, guids[i]))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -5,6 +5,10 @@ db_address = os.getenv('TESTING_TEMPLATE_DB_ADDRESS')
 db_user = os.getenv('TESTING_TEMPLATE_DB_USER')
 db_password = os.getenv('TESTING_TEMPLATE_DB_PASSWORD')
 db_name = os.getenv('TESTING_TEMPLATE_DB_NAME')
+# Optional read replica, uses the same user, password and database name as the primary
+db_replica_address = os.getenv('TESTING_TEMPLATE_DB_REPLICA_ADDRESS')
+# LISTEN needs a session level connection, set it when db_address is a transaction pooling bouncer
+db_listen_address = os.getenv('TESTING_TEMPLATE_DB_LISTEN_ADDRESS', db_address)
 
 tg_secret_token = os.getenv('TESTING_TEMPLATE_TG_TOKEN')
 
@@ -5,6 +5,41 @@ IS_PROD = bool(int(os.getenv('TESTING_TEMPLATE_IS_PROD', '0')))
 ALGORITHM = 'HS256'
 ACCESS_TOKEN_EXPIRE_MINUTES = 15
 REFRESH_TOKEN_EXPIRE_MINUTES = 43200
+# Build the current user from access token claims instead of loading it from the database.
+# Role changes then take effect only after the access token is refreshed.
+IS_STATELESS_AUTH = bool(int(os.getenv('TESTING_TEMPLATE_IS_STATELESS_AUTH', '0')))
+# How many verified tokens to keep decoded in memory, 0 disables the cache
+JWT_CACHE_SIZE = int(os.getenv('TESTING_TEMPLATE_JWT_CACHE_SIZE', '10000'))
+
+# bcrypt runs in a process pool: PASSWORD_POOL_WORKERS hashes at once,
+# up to PASSWORD_POOL_QUEUE more wait and the rest get 503
+PASSWORD_POOL_WORKERS = int(os.getenv('TESTING_TEMPLATE_PASSWORD_POOL_WORKERS', '2'))
+PASSWORD_POOL_QUEUE = int(os.getenv('TESTING_TEMPLATE_PASSWORD_POOL_QUEUE', '32'))
+
+DB_POOL_SIZE = int(os.getenv('TESTING_TEMPLATE_DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('TESTING_TEMPLATE_DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv('TESTING_TEMPLATE_DB_POOL_TIMEOUT_SECONDS', '30'))
+# -1 keeps connections open forever
+DB_POOL_RECYCLE_SECONDS = int(os.getenv('TESTING_TEMPLATE_DB_POOL_RECYCLE_SECONDS', '-1'))
+DB_POOL_PRE_PING = bool(int(os.getenv('TESTING_TEMPLATE_DB_POOL_PRE_PING', '0')))
+# Prepared statements cached per asyncpg connection
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('TESTING_TEMPLATE_DB_STATEMENT_CACHE_SIZE', '100'))
+# Set when connecting through a transaction pooling bouncer: no app side pool, no prepared statement cache
+DB_BOUNCER_MODE = bool(int(os.getenv('TESTING_TEMPLATE_DB_BOUNCER_MODE', '0')))
+
+# After a client writes, its reads go to the primary for this long so it sees its own writes on a lagging replica
+READ_YOUR_WRITES_SECONDS = int(os.getenv('TESTING_TEMPLATE_READ_YOUR_WRITES_SECONDS', '5'))
+
+# Rows changed per statement and commit by superuser bulk operations
+BULK_BATCH_SIZE = int(os.getenv('TESTING_TEMPLATE_BULK_BATCH_SIZE', '1000'))
+
+# Rows per COPY and commit of the bulk import
+IMPORT_BATCH_SIZE = int(os.getenv('TESTING_TEMPLATE_IMPORT_BATCH_SIZE', '5000'))
+# Imported passwords are hashed in a separate pool so imports don't starve logins
+IMPORT_POOL_WORKERS = int(os.getenv('TESTING_TEMPLATE_IMPORT_POOL_WORKERS', '2'))
+
+# Rows fetched per round trip by the streaming export
+EXPORT_BATCH_SIZE = int(os.getenv('TESTING_TEMPLATE_EXPORT_BATCH_SIZE', '1000'))
 
 IS_SECURE_COOKIE = IS_PROD
 SAME_SITE = 'lax'
@@ -16,8 +51,57 @@ JAEGER_BACKEND = os.getenv('TESTING_TEMPLATE_JAEGER_BACKEND', 'localhost:4317')
 GMAIL_API_TOKEN = os.getenv('TESTING_TEMPLATE_GMAIL_API_TOKEN', '')
 FRONTEND_URL = os.getenv('TESTING_TEMPLATE_FRONTEND_URL', '')
 
+OUTBOX_BATCH_SIZE = int(os.getenv('TESTING_TEMPLATE_OUTBOX_BATCH_SIZE', '50'))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv('TESTING_TEMPLATE_OUTBOX_POLL_INTERVAL_SECONDS', '2'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('TESTING_TEMPLATE_OUTBOX_MAX_ATTEMPTS', '5'))
+# Delay before the first retry, doubled on every next attempt
+OUTBOX_BACKOFF_SECONDS = float(os.getenv('TESTING_TEMPLATE_OUTBOX_BACKOFF_SECONDS', '30'))
+
 ALLOWED_ORIGINS = [FRONTEND_URL] if IS_PROD else ['http://localhost:3000', FRONTEND_URL]
 
+REDIS_URL = os.getenv('TESTING_TEMPLATE_REDIS_URL', 'redis://localhost:6379/0')
+
+# 'memory' keeps feed pages per process, 'redis' shares them between pods through REDIS_URL
+FEED_CACHE_BACKEND = os.getenv('TESTING_TEMPLATE_FEED_CACHE_BACKEND', 'memory')
+FEED_CACHE_TTL_SECONDS = float(os.getenv('TESTING_TEMPLATE_FEED_CACHE_TTL_SECONDS', '5'))
+FEED_CACHE_SIZE = int(os.getenv('TESTING_TEMPLATE_FEED_CACHE_SIZE', '1000'))
+
+# Rows of row_counters per counted table, more shards mean less lock contention between writers
+COUNTER_SHARDS = int(os.getenv('TESTING_TEMPLATE_COUNTER_SHARDS', '16'))
+
+# Token bucket rate limits of expensive endpoints, see src.rate_limits
+IS_RATE_LIMIT_ENABLED = bool(int(os.getenv('TESTING_TEMPLATE_IS_RATE_LIMIT_ENABLED', '1')))
+# 'memory' limits per process, 'redis' shares buckets between pods through REDIS_URL
+RATE_LIMIT_BACKEND = os.getenv('TESTING_TEMPLATE_RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_SHARDS = int(os.getenv('TESTING_TEMPLATE_RATE_LIMIT_SHARDS', '16'))
+RATE_LIMIT_MAX_KEYS = int(os.getenv('TESTING_TEMPLATE_RATE_LIMIT_MAX_KEYS', '100000'))
+# Take the client ip from X-Forwarded-For, only behind a proxy that sets it
+IS_RATE_LIMIT_TRUST_FORWARDED = bool(int(os.getenv('TESTING_TEMPLATE_IS_RATE_LIMIT_TRUST_FORWARDED', '0')))
+LOGIN_IP_PER_MINUTE = float(os.getenv('TESTING_TEMPLATE_LOGIN_IP_PER_MINUTE', '30'))
+LOGIN_IP_BURST = int(os.getenv('TESTING_TEMPLATE_LOGIN_IP_BURST', '10'))
+LOGIN_EMAIL_PER_MINUTE = float(os.getenv('TESTING_TEMPLATE_LOGIN_EMAIL_PER_MINUTE', '5'))
+LOGIN_EMAIL_BURST = int(os.getenv('TESTING_TEMPLATE_LOGIN_EMAIL_BURST', '5'))
+CHANGE_PASSWORD_USER_PER_MINUTE = float(os.getenv('TESTING_TEMPLATE_CHANGE_PASSWORD_USER_PER_MINUTE', '5'))
+CHANGE_PASSWORD_USER_BURST = int(os.getenv('TESTING_TEMPLATE_CHANGE_PASSWORD_USER_BURST', '5'))
+REGISTER_IP_PER_MINUTE = float(os.getenv('TESTING_TEMPLATE_REGISTER_IP_PER_MINUTE', '10'))
+REGISTER_IP_BURST = int(os.getenv('TESTING_TEMPLATE_REGISTER_IP_BURST', '10'))
+NEW_TWEET_USER_PER_MINUTE = float(os.getenv('TESTING_TEMPLATE_NEW_TWEET_USER_PER_MINUTE', '30'))
+NEW_TWEET_USER_BURST = int(os.getenv('TESTING_TEMPLATE_NEW_TWEET_USER_BURST', '10'))
+
+# Monthly tweets partitions created ahead of the current month
+TWEET_PARTITIONS_AHEAD = int(os.getenv('TESTING_TEMPLATE_TWEET_PARTITIONS_AHEAD', '3'))
+
+# New tweets buffered per /tweets/stream client before the oldest are dropped
+STREAM_BUFFER_SIZE = int(os.getenv('TESTING_TEMPLATE_STREAM_BUFFER_SIZE', '100'))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv('TESTING_TEMPLATE_STREAM_HEARTBEAT_SECONDS', '15'))
+
 S3_ENDPOINT = os.getenv('TESTING_TEMPLATE_S3_ENDPOINT', '')
 BUCKET = os.getenv('TESTING_TEMPLATE_BUCKET', '')
-IS_S3_MOCK = os.getenv('TESTING_TEMPLATE_IS_S3_MOCK', '0')
+IS_S3_MOCK = bool(int(os.getenv('TESTING_TEMPLATE_IS_S3_MOCK', '0')))
+# Uploads are sent to s3 in multipart chunks of this size, minio requires at least 5MiB
+S3_PART_SIZE = int(os.getenv('TESTING_TEMPLATE_S3_PART_SIZE', str(5 * 2 ** 20)))
+MAX_PHOTO_SIZE = int(os.getenv('TESTING_TEMPLATE_MAX_PHOTO_SIZE', str(10 * 2 ** 20)))
+# Uploaded photos are also stored resized to fit each of these sizes
+PHOTO_SIZES = tuple(int(size) for size in os.getenv('TESTING_TEMPLATE_PHOTO_SIZES', '64,256').split(','))
+PHOTO_POOL_WORKERS = int(os.getenv('TESTING_TEMPLATE_PHOTO_POOL_WORKERS', '1'))
+PHOTO_POOL_QUEUE = int(os.getenv('TESTING_TEMPLATE_PHOTO_POOL_QUEUE', '16'))
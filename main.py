@@ -15,13 +15,42 @@ from src.service.auth import auth_router
 from src.service.superuser import superuser_router
 from src.service.user import user_router
 from src.service.tweets import tweet_router
-from src.dependencies import AsyncSessionDep
+from src.dependencies import AsyncSessionDep, PRIMARY_STICKY_COOKIE, PRIMARY_STICKY_STATE
+from src.passwords import password_pool
+from src.photos import photo_pool
+from src.importer import import_pool
+from src.tweet_stream import tweet_listener
+from src.partitions import ensure_partitions_on_startup
+from src import rate_limits
+from utils.body_limit import BodySizeLimitMiddleware
+from utils.rate_limit import RateLimitMiddleware
+from utils.sticky_cookie import StickyCookieMiddleware
 from starlette_exporter import PrometheusMiddleware, handle_metrics
 
 from conf import settings
 
 app = FastAPI(title=settings.APP_NAME, version='0.1.1')
 
+app.add_middleware(StickyCookieMiddleware,
+                   state_key=PRIMARY_STICKY_STATE,
+                   cookie=PRIMARY_STICKY_COOKIE,
+                   value='1',
+                   max_age=settings.READ_YOUR_WRITES_SECONDS,
+                   samesite=settings.SAME_SITE,
+                   secure=settings.IS_SECURE_COOKIE,
+                   httponly=True)
+
+if settings.IS_RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware,
+                       policies=rate_limits.POLICIES,
+                       backend=rate_limits.rate_limit_backend,
+                       get_user_guid=rate_limits.get_user_guid,
+                       trust_forwarded=settings.IS_RATE_LIMIT_TRUST_FORWARDED)
+
+# Multipart framing adds a little on top of the file itself
+app.add_middleware(BodySizeLimitMiddleware,
+                   limits={'/user/upload_photo': settings.MAX_PHOTO_SIZE + 2 ** 16})
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_ORIGINS,
@@ -57,6 +86,19 @@ app.include_router(router=tweet_router,
 app.add_route("/metrics", handle_metrics)
 
 
+@app.on_event('startup')
+async def create_partitions():
+    await ensure_partitions_on_startup()
+
+
+@app.on_event('shutdown')
+async def shutdown_pools():
+    password_pool.shutdown()
+    photo_pool.shutdown()
+    import_pool.shutdown()
+    await tweet_listener.close()
+
+
 @app.get('/ping')
 async def ping():
     return 'pong'
@@ -0,0 +1,28 @@
+"""tweets_author_feed_index
+
+Revision ID: 4d9a0b7e6f21
+Revises: c3f81a5e2d76
+Create Date: 2026-10-18 16:05:12.871540
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d9a0b7e6f21'
+down_revision = 'c3f81a5e2d76'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_tweets_author_feed', 'tweets',
+                    ['created_by_guid', sa.text('created_at DESC'), sa.text('guid DESC')],
+                    unique=False,
+                    postgresql_where=sa.text('is_deleted = false'))
+
+
+def downgrade():
+    op.drop_index('ix_tweets_author_feed', table_name='tweets',
+                  postgresql_where=sa.text('is_deleted = false'))
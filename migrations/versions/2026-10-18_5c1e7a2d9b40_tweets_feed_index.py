@@ -0,0 +1,28 @@
+"""tweets_feed_index
+
+Revision ID: 5c1e7a2d9b40
+Revises: bae2e0cfdf38
+Create Date: 2026-10-18 10:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e7a2d9b40'
+down_revision = 'bae2e0cfdf38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_tweets_feed', 'tweets',
+                    [sa.text('created_at DESC'), sa.text('guid DESC')],
+                    unique=False,
+                    postgresql_where=sa.text('is_deleted = false'))
+
+
+def downgrade():
+    op.drop_index('ix_tweets_feed', table_name='tweets',
+                  postgresql_where=sa.text('is_deleted = false'))
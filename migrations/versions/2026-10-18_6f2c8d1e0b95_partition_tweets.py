@@ -0,0 +1,100 @@
+"""partition_tweets
+
+Revision ID: 6f2c8d1e0b95
+Revises: e81b5c3a9d04
+Create Date: 2026-10-18 17:31:54.092716
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f2c8d1e0b95'
+down_revision = 'e81b5c3a9d04'
+branch_labels = None
+depends_on = None
+
+# Same as src.partitions, copied so the migration does not change with the app code
+MONTHS_AHEAD = 3
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def create_feed_indexes():
+    op.create_index('ix_tweets_feed', 'tweets',
+                    [sa.text('created_at DESC'), sa.text('guid DESC')],
+                    unique=False,
+                    postgresql_where=sa.text('is_deleted = false'))
+    op.create_index('ix_tweets_author_feed', 'tweets',
+                    ['created_by_guid', sa.text('created_at DESC'), sa.text('guid DESC')],
+                    unique=False,
+                    postgresql_where=sa.text('is_deleted = false'))
+
+
+def upgrade():
+    # Rewrites the whole table under an exclusive lock, run it in a maintenance window
+    op.execute('LOCK TABLE tweets IN ACCESS EXCLUSIVE MODE')
+    op.execute('ALTER TABLE tweets RENAME TO tweets_unpartitioned')
+    op.execute('ALTER TABLE tweets_unpartitioned RENAME CONSTRAINT tweets_pkey TO tweets_unpartitioned_pkey')
+    op.execute('ALTER INDEX ix_tweets_feed RENAME TO ix_tweets_unpartitioned_feed')
+    op.execute('ALTER INDEX ix_tweets_author_feed RENAME TO ix_tweets_unpartitioned_author_feed')
+
+    op.create_table('tweets',
+                    sa.Column('guid', sa.UUID(), nullable=False),
+                    sa.Column('message', sa.Text(), nullable=False),
+                    sa.Column('created_by_guid', sa.UUID(), nullable=True),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                              nullable=False),
+                    sa.Column('is_deleted', sa.Boolean(), nullable=False),
+                    sa.ForeignKeyConstraint(['created_by_guid'], ['users.guid'], ),
+                    sa.PrimaryKeyConstraint('guid', 'created_at'),
+                    postgresql_partition_by='RANGE (created_at)'
+                    )
+    op.execute('CREATE TABLE tweets_default PARTITION OF tweets DEFAULT')
+
+    bind = op.get_bind()
+    oldest = bind.execute(sa.text("SELECT min(created_at) AT TIME ZONE 'UTC' FROM tweets_unpartitioned")).scalar()
+    current = datetime.datetime.now(datetime.timezone.utc).date().replace(day=1)
+    month = oldest.date().replace(day=1) if oldest is not None else current
+    while month <= add_months(current, MONTHS_AHEAD):
+        op.execute(f"CREATE TABLE tweets_y{month.year}m{month.month:02d} PARTITION OF tweets "
+                   f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') "
+                   f"TO ('{add_months(month, 1).isoformat()} 00:00:00+00')")
+        month = add_months(month, 1)
+
+    op.execute('INSERT INTO tweets (guid, message, created_by_guid, created_at, is_deleted) '
+               'SELECT guid, message, created_by_guid, created_at, is_deleted FROM tweets_unpartitioned')
+    op.drop_table('tweets_unpartitioned')
+    # Created on the parent, Postgres builds them on every partition
+    create_feed_indexes()
+    op.execute('ANALYZE tweets')
+
+
+def downgrade():
+    op.execute('LOCK TABLE tweets IN ACCESS EXCLUSIVE MODE')
+    op.execute('ALTER TABLE tweets RENAME TO tweets_partitioned')
+    op.execute('ALTER TABLE tweets_partitioned RENAME CONSTRAINT tweets_pkey TO tweets_partitioned_pkey')
+    op.execute('ALTER INDEX ix_tweets_feed RENAME TO ix_tweets_partitioned_feed')
+    op.execute('ALTER INDEX ix_tweets_author_feed RENAME TO ix_tweets_partitioned_author_feed')
+
+    op.create_table('tweets',
+                    sa.Column('guid', sa.UUID(), nullable=False),
+                    sa.Column('message', sa.Text(), nullable=False),
+                    sa.Column('created_by_guid', sa.UUID(), nullable=True),
+                    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'),
+                              nullable=False),
+                    sa.Column('is_deleted', sa.Boolean(), nullable=False),
+                    sa.ForeignKeyConstraint(['created_by_guid'], ['users.guid'], ),
+                    sa.PrimaryKeyConstraint('guid')
+                    )
+    op.execute('INSERT INTO tweets (guid, message, created_by_guid, created_at, is_deleted) '
+               'SELECT guid, message, created_by_guid, created_at, is_deleted FROM tweets_partitioned')
+    # Drops all partitions with it, detached ones are left alone
+    op.drop_table('tweets_partitioned')
+    create_feed_indexes()
@@ -0,0 +1,31 @@
+"""users_search_vector
+
+Revision ID: 7a4c2e91d5f8
+Revises: 2b8d6e0f4a13
+Create Date: 2026-10-18 13:41:27.650121
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4c2e91d5f8'
+down_revision = '2b8d6e0f4a13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('search_vector', postgresql.TSVECTOR(),
+                                     sa.Computed("to_tsvector('simple', coalesce(first_name, '') || ' ' || "
+                                                 "coalesce(last_name, '') || ' ' || coalesce(email, ''))",
+                                                 persisted=True),
+                                     nullable=True))
+    op.create_index('ix_users_search_vector', 'users', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_users_search_vector', table_name='users', postgresql_using='gin')
+    op.drop_column('users', 'search_vector')
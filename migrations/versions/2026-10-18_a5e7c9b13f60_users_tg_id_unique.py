@@ -0,0 +1,24 @@
+"""users_tg_id_unique
+
+Revision ID: a5e7c9b13f60
+Revises: 6f2c8d1e0b95
+Create Date: 2026-10-18 18:14:09.551382
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5e7c9b13f60'
+down_revision = '6f2c8d1e0b95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fails if concurrent telegram logins ever created two users with one tg_id, merge them first
+    op.create_index('ix_users_tg_id', 'users', ['tg_id'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_users_tg_id', table_name='users')
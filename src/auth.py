@@ -1,20 +1,48 @@
+import hashlib
 from typing import Annotated
 
 import fastapi
 from fastapi import Depends, HTTPException, status
 from fastapi.security import APIKeyCookie, OAuth2PasswordBearer
 from jose import jwt, JWTError, ExpiredSignatureError
+from prometheus_client import Counter
 
 import src.db_models as db
+from src import json_schemes
 from conf import settings
 from conf.secrets import PASSWORD_ENCODING_SECRET
 from .dependencies import AsyncSessionDep
 from src.repo import user as user_repo
 from src.roles import Role
+from utils.cache import LRUCache
 
 apikey_cookie_getter = APIKeyCookie(name='login_token', auto_error=False)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/auth/login/email', auto_error=False)
 
+jwt_cache = LRUCache(max_size=settings.JWT_CACHE_SIZE)
+JWT_CACHE_HITS = Counter('jwt_cache_hits_total', 'Tokens whose claims were taken from the verified jwt cache')
+JWT_CACHE_MISSES = Counter('jwt_cache_misses_total', 'Tokens that had to be fully decoded and verified')
+
+
+def decode_token(token: str) -> dict:
+    """
+    Verifies the token and returns its claims.
+    Claims of a valid token are cached until its `exp`, so a client sending the same token again
+    skips signature verification. Tokens that fail verification are never cached.
+    The returned dict is shared between requests and must not be modified.
+    :raises JWTError: ExpiredSignatureError if the token expired, JWTError if it is malformed
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    claims = jwt_cache.get(key)
+    if claims is not None:
+        JWT_CACHE_HITS.inc()
+        return claims
+    JWT_CACHE_MISSES.inc()
+    claims = jwt.decode(token, PASSWORD_ENCODING_SECRET, algorithms=[settings.ALGORITHM])
+    if isinstance(claims.get('exp'), (int, float)):
+        jwt_cache.set(key, claims, expires_at=claims['exp'])
+    return claims
+
 
 async def get_user_from_refresh_token(async_session: AsyncSessionDep, token=Depends(apikey_cookie_getter),
                                       fake_email: Annotated[str | None, fastapi.Header()] = None,
@@ -29,7 +57,7 @@ async def get_user_from_refresh_token(async_session: AsyncSessionDep, token=Depe
     if token is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authorized. Please log in.")
     try:
-        payload = jwt.decode(token, PASSWORD_ENCODING_SECRET, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token)
         user_guid = payload.get("sub")
         if user_guid is None:
             raise HTTPException(
@@ -56,14 +84,19 @@ async def get_user_from_refresh_token(async_session: AsyncSessionDep, token=Depe
 
 
 async def get_current_user(async_session: AsyncSessionDep, token: Annotated[str, Depends(oauth2_scheme)]
-                           ) -> db.User:
+                           ) -> db.User | json_schemes.Principal:
+    """
+    Returns the user the access token belongs to.
+    With settings.IS_STATELESS_AUTH the user is built from the token claims and no query is made,
+    so handlers that write to the user must depend on get_current_user_orm instead.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, PASSWORD_ENCODING_SECRET, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token)
         user_guid: str = payload.get("sub")
         if user_guid is None:
             raise credentials_exception
@@ -77,6 +110,8 @@ async def get_current_user(async_session: AsyncSessionDep, token: Annotated[str,
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"jwt error: {e}",
         )
+    if settings.IS_STATELESS_AUTH:
+        return json_schemes.Principal.from_claims(payload)
     user = await user_repo.get_user(async_session, user_guid=user_guid)
     if user is None:
         raise HTTPException(
@@ -86,10 +121,26 @@ async def get_current_user(async_session: AsyncSessionDep, token: Annotated[str,
     return user
 
 
-CurrentUserDep = Annotated[db.User, Depends(get_current_user)]
+async def get_current_user_orm(async_session: AsyncSessionDep,
+                               current_user: db.User | json_schemes.Principal = Depends(get_current_user)
+                               ) -> db.User:
+    if isinstance(current_user, db.User):
+        return current_user
+    user = await user_repo.get_user(async_session, user_guid=current_user.guid)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not get user from user_repo",
+        )
+    return user
+
+
+CurrentUserDep = Annotated[db.User | json_schemes.Principal, Depends(get_current_user)]
+CurrentUserORMDep = Annotated[db.User, Depends(get_current_user_orm)]
 
 
-async def get_current_superuser(current_user: db.User = Depends(get_current_user)):
+async def get_current_superuser(current_user: db.User | json_schemes.Principal = Depends(get_current_user)):
+    # Works the same for an ORM user and for a principal built from the token claims
     if Role.Admin.value not in current_user.roles:
         raise HTTPException(status_code=status.HTTP_405_METHOD_NOT_ALLOWED)
     else:
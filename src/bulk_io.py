@@ -0,0 +1,93 @@
+import csv
+import io
+import itertools
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+FORMATS = ('ndjson', 'csv')
+
+
+def get_format(filename: str) -> str:
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if extension == 'csv':
+        return 'csv'
+    raise ValueError(f'Unknown format of {filename}, expected one of {FORMATS}')
+
+
+def iter_records(lines: Iterable[str], fmt: str) -> Iterator[tuple[int, dict]]:
+    """
+    Parses NDJSON or CSV (with a header row) lazily, one record at a time.
+    Empty CSV cells are left out so that optional fields get their defaults.
+    :return: (line number, record) pairs, record is None for a line that is not valid JSON
+    """
+    if fmt == 'ndjson':
+        for line_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except json.JSONDecodeError:
+                yield line_no, None
+    elif fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, {key: value for key, value in record.items() if value != ''}
+    else:
+        raise ValueError(f'Unknown format {fmt}, expected one of {FORMATS}')
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def get_csv_value(value: Any) -> Any:
+    # Lists are written comma separated as iter_records expects them, nested objects as JSON
+    if value is None:
+        return ''
+    if isinstance(value, list):
+        return ','.join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return value
+
+
+def get_csv_line(values: Iterable[Any]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([get_csv_value(value) for value in values])
+    return buffer.getvalue()
+
+
+async def encode_records(records: AsyncIterable[BaseModel], schema: type[BaseModel], fmt: str,
+                         chunk_size: int = 2 ** 16) -> AsyncIterator[str]:
+    """
+    Encodes records as NDJSON or CSV (with a header row) for a streaming response.
+    Lines are joined into chunks of about chunk_size characters, the first record is sent right away.
+    """
+    columns = list(schema.__fields__)
+    chunk = []
+    chunk_length = 0
+    is_first = True
+    if fmt == 'csv':
+        yield get_csv_line(columns)
+    async for record in records:
+        if fmt == 'csv':
+            encoded = jsonable_encoder(record)
+            line = get_csv_line(encoded[column] for column in columns)
+        else:
+            line = record.json() + '\n'
+        chunk.append(line)
+        chunk_length += len(line)
+        if is_first or chunk_length >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            chunk_length = 0
+            is_first = False
+    if chunk:
+        yield ''.join(chunk)
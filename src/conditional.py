@@ -0,0 +1,38 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response, status
+from prometheus_client import Counter
+
+CONDITIONAL_REQUESTS = Counter('conditional_requests_total',
+                               'Requests with If-None-Match, hit is answered with 304 Not Modified',
+                               ['endpoint', 'result'])
+
+
+def get_etag(body: bytes) -> str:
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def is_etag_matching(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+def is_not_modified(request: Request, etag: str, endpoint: str) -> bool:
+    """
+    Whether the client already has the representation tagged with etag
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is None:
+        return False
+    is_hit = is_etag_matching(if_none_match, etag)
+    CONDITIONAL_REQUESTS.labels(endpoint, 'hit' if is_hit else 'miss').inc()
+    return is_hit
+
+
+def get_not_modified_response(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
@@ -1,6 +1,8 @@
-from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import Column, Boolean, Text, ARRAY, DateTime, func, ForeignKey
+from sqlalchemy.orm import declarative_base, relationship, deferred
+from sqlalchemy.dialects.postgresql import UUID, JSONB, TSVECTOR
+from sqlalchemy import (Column, Boolean, Text, ARRAY, DateTime, Integer, BigInteger, func, ForeignKey, Index, false,
+                        Computed, text)
+from sqlalchemy import DDL, event
 import uuid
 
 
@@ -21,15 +23,69 @@ class User(Base):
     is_active = Column(Boolean, nullable=False, default=True)
     roles = Column(ARRAY(Text), nullable=True, default=[])
     photo_url = Column(Text, nullable=True)
+    # Resized copies of photo_url, size -> url, filled in after the upload is processed
+    photo_urls = Column(JSONB, nullable=True)
     created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Bumped by every UPDATE of the row, ORM flushes and bulk statements alike. ETag of GET /user/info
+    version = Column(Integer, nullable=False, default=1, server_default='1', onupdate=text('version + 1'))
+    # Used by superuser search, must stay in sync with the text search config in repo.user
+    search_vector = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', coalesce(first_name, '') || ' ' || "
+                                                       "coalesce(last_name, '') || ' ' || coalesce(email, ''))",
+                                                       persisted=True)))
 
 
 class Tweet(Base):
+    """
+    Range partitioned by created_at month, partitions are managed by src.partitions.
+    The partition key has to be part of the primary key
+    """
     __tablename__ = 'tweets'
+    __table_args__ = {'postgresql_partition_by': 'RANGE (created_at)'}
 
     guid: uuid.UUID = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     message = Column(Text, nullable=False)
     created_by_guid = Column(ForeignKey("users.guid"))
     created_by = relationship("User", lazy="joined")
-    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    created_at = Column(DateTime(timezone=True), primary_key=True, nullable=False, server_default=func.now())
     is_deleted = Column(Boolean, nullable=False, default=False)
+
+
+# Catches rows no monthly partition exists for, e.g. in a database made with metadata.create_all
+event.listen(Tweet.__table__, 'after_create',
+             DDL('CREATE TABLE IF NOT EXISTS tweets_default PARTITION OF tweets DEFAULT'))
+
+
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+
+    guid: uuid.UUID = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    recipient = Column(Text, nullable=False)
+    subject = Column(Text, nullable=False)
+    message_text = Column(Text, nullable=False)
+    status = Column(Text, nullable=False, default='pending')
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+
+class RowCounter(Base):
+    """
+    Row count of a table split into shards, so concurrent writers rarely update the same row.
+    The count is the sum over all shards of the name
+    """
+    __tablename__ = 'row_counters'
+
+    name = Column(Text, primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    count = Column(BigInteger, nullable=False, default=0)
+
+
+Index('ix_users_search_vector', User.search_vector, postgresql_using='gin')
+# Conflict target of the telegram login upsert
+Index('ix_users_tg_id', User.tg_id, unique=True)
+Index('ix_tweets_feed', Tweet.created_at.desc(), Tweet.guid.desc(), postgresql_where=Tweet.is_deleted == false())
+Index('ix_tweets_author_feed', Tweet.created_by_guid, Tweet.created_at.desc(), Tweet.guid.desc(),
+      postgresql_where=Tweet.is_deleted == false())
+Index('ix_email_outbox_pending', EmailOutbox.next_attempt_at, postgresql_where=EmailOutbox.status == 'pending')
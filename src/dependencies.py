@@ -1,18 +1,31 @@
 from conf import secrets
 from typing import Annotated
 
-from fastapi import Depends
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from utils import comms
 from utils import s3
-from utils.db_connection import AsyncMainSession
+from utils.db_connection import AsyncMainSession, AsyncReplicaSession
 from utils.db_connection_sync import SyncMainSession
 
 from conf import settings
 
 
-async def get_async_session():
+PRIMARY_STICKY_COOKIE = 'db_primary_sticky'
+# Set in request.state by get_async_session, StickyCookieMiddleware then sets PRIMARY_STICKY_COOKIE
+PRIMARY_STICKY_STATE = 'is_primary_sticky'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def mark_primary_sticky(request: Request):
+    if request.method not in SAFE_METHODS:
+        # Reads of this client go to the primary until the cookie expires, see get_async_read_session
+        setattr(request.state, PRIMARY_STICKY_STATE, True)
+
+
+async def get_async_session(request: Request):
+    mark_primary_sticky(request)
     async_session = AsyncMainSession()
     try:
         yield async_session
@@ -20,6 +33,34 @@ async def get_async_session():
         await async_session.close()
 
 
+def is_primary_sticky(request: Request) -> bool:
+    """
+    Whether the client has written recently, so its reads must see the primary
+    """
+    return request.cookies.get(PRIMARY_STICKY_COOKIE) is not None
+
+
+async def get_async_read_session(request: Request):
+    """
+    Session for read-only endpoints. Uses the replica, unless the client has written recently
+    """
+    if is_primary_sticky(request):
+        async_session = AsyncMainSession()
+    else:
+        async_session = AsyncReplicaSession()
+    try:
+        yield async_session
+    finally:
+        await async_session.close()
+
+
+def get_async_session_maker():
+    """
+    For work outliving the request, e.g. background tasks opening their own sessions
+    """
+    return AsyncMainSession
+
+
 # In case of sync testing
 def get_sync_session():
     session = SyncMainSession()
@@ -36,15 +77,18 @@ def get_email_sender():
 
 
 def get_s3():
-    if settings.IS_S3_MOCK:
+    if not settings.IS_S3_MOCK:
         return s3.S3Storage(endpoint=settings.S3_ENDPOINT,
                             access_key=secrets.s3_access_key,
                             secret_key=secrets.s3_secret_key,
                             bucket_name=settings.BUCKET,
+                            part_size=settings.S3_PART_SIZE,
                             )
     return s3.S3StorageBase()
 
 
 AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_session)]
+AsyncReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_session)]
+AsyncSessionMakerDep = Annotated[async_sessionmaker, Depends(get_async_session_maker)]
 EmailSenderDep = Annotated[comms.EmailSender, Depends(get_email_sender)]
-S3PublicDep = Annotated[s3.S3Storage, Depends(get_s3)]
+S3PublicDep = Annotated[s3.S3StorageBase, Depends(get_s3)]
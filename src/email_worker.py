@@ -0,0 +1,67 @@
+"""
+Delivers emails from the outbox table.
+Run it as a separate process next to the app:
+    python -m src.email_worker
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from conf import settings
+from src.dependencies import get_email_sender
+from src.repo import outbox as outbox_repo
+from utils import comms
+from utils.db_connection import AsyncMainSession
+
+logger = logging.getLogger('email_worker')
+
+
+async def deliver_batch(async_session: AsyncSession, sender: comms.EmailSender,
+                        batch_size: int = settings.OUTBOX_BATCH_SIZE) -> int:
+    """
+    Sends one batch of due emails and commits their new state.
+    Failed emails are retried with exponential backoff until OUTBOX_MAX_ATTEMPTS is reached.
+    :return: number of emails processed
+    """
+    emails = await outbox_repo.claim_pending(async_session, batch_size)
+    for email in emails:
+        email.attempts += 1
+        try:
+            # Senders are blocking (googleapiclient), keep them off the event loop
+            await asyncio.to_thread(sender.send, email.recipient, email.subject, email.message_text)
+        except Exception as e:
+            logger.warning(f"Error while sending message to {email.recipient}. "
+                           f"Subject: {email.subject}. "
+                           f"Error: {str(e)}. "
+                           f"Attempt: {email.attempts}")
+            email.last_error = str(e)
+            if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                email.status = outbox_repo.FAILED
+            else:
+                backoff = settings.OUTBOX_BACKOFF_SECONDS * 2 ** (email.attempts - 1)
+                email.next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=backoff)
+        else:
+            email.status = outbox_repo.SENT
+            email.sent_at = datetime.now(timezone.utc)
+    await async_session.commit()
+    return len(emails)
+
+
+async def run_worker(sender: comms.EmailSender):
+    logger.info("Email worker started")
+    while True:
+        try:
+            async with AsyncMainSession() as async_session:
+                processed = await deliver_batch(async_session, sender)
+        except Exception:
+            logger.exception("Failed to process outbox batch")
+            processed = 0
+        if processed < settings.OUTBOX_BATCH_SIZE:
+            await asyncio.sleep(settings.OUTBOX_POLL_INTERVAL_SECONDS)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(get_email_sender()))
@@ -0,0 +1,54 @@
+from typing import Optional
+
+from prometheus_client import Counter
+
+from conf import settings
+from src.conditional import get_etag
+from utils.cache import CacheBackend, InMemoryCacheBackend, RedisCacheBackend
+
+FEED_PREFIX = 'feed:'
+
+FEED_CACHE_HITS = Counter('feed_cache_hits_total', 'Feed pages served from the response cache')
+FEED_CACHE_MISSES = Counter('feed_cache_misses_total', 'Feed pages that had to be queried and serialized')
+
+
+def get_cache_backend() -> CacheBackend:
+    if settings.FEED_CACHE_BACKEND == 'redis':
+        return RedisCacheBackend(settings.REDIS_URL)
+    return InMemoryCacheBackend(max_size=settings.FEED_CACHE_SIZE)
+
+
+# Serialized pages of GET /tweets. With the in-memory backend a tweet posted through another pod
+# shows up here only after FEED_CACHE_TTL_SECONDS
+feed_cache: CacheBackend = get_cache_backend()
+
+
+def get_page_key(**params) -> str:
+    return FEED_PREFIX + '&'.join(f'{name}={value}' for name, value in sorted(params.items()))
+
+
+async def get_page(key: str) -> Optional[tuple[str, bytes]]:
+    """
+    :return: ETag and body of the cached page
+    """
+    value = await feed_cache.get(key)
+    if value is None:
+        FEED_CACHE_MISSES.inc()
+        return None
+    FEED_CACHE_HITS.inc()
+    etag, body = value.split(b'\n', 1)
+    return etag.decode(), body
+
+
+async def set_page(key: str, body: bytes) -> str:
+    """
+    Caches the page together with its ETag, so conditional requests are answered without hashing the body again
+    :return: ETag of the page
+    """
+    etag = get_etag(body)
+    await feed_cache.set(key, etag.encode() + b'\n' + body, ttl=settings.FEED_CACHE_TTL_SECONDS)
+    return etag
+
+
+async def invalidate():
+    await feed_cache.delete_prefix(FEED_PREFIX)
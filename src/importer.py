@@ -0,0 +1,134 @@
+"""
+Bulk import of users and tweets from NDJSON or CSV files.
+Also available to superusers as POST /superuser/import/{kind}. From the command line:
+    python -m src.importer users users.ndjson
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Iterable, Optional
+
+import asyncpg
+import pydantic
+import sqlalchemy.exc
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from conf import settings
+from src import json_schemes
+from src.bulk_io import iter_records, batched, get_format
+from src.passwords import hash_passwords_sync
+from src.repo import bulk as bulk_repo
+from src.repo import counter as counter_repo
+from utils.db_connection import AsyncMainSession
+from utils.workers import BoundedProcessPool, PoolOverloaded
+
+KINDS = ('users', 'tweets')
+MAX_ERRORS_PER_BATCH = 100
+# Suggested to clients turned away while another users import runs
+RETRY_AFTER_SECONDS = 30
+
+import_pool = BoundedProcessPool('import', max_workers=settings.IMPORT_POOL_WORKERS, max_queue=0)
+
+
+async def hash_passwords(passwords: list[str]) -> list[str]:
+    # One chunk per worker, so a batch is hashed by all of them in parallel
+    chunk_size = max(1, -(-len(passwords) // import_pool.max_workers))
+    chunks = await asyncio.gather(*[import_pool.run(hash_passwords_sync, passwords[i:i + chunk_size])
+                                    for i in range(0, len(passwords), chunk_size)])
+    return [hashed for chunk in chunks for hashed in chunk]
+
+
+def is_pool_busy(kind: str) -> bool:
+    """
+    Whether importing `kind` now would find the import pool busy.
+    Every batch of users takes all of its workers, so only one users import runs at a time
+    """
+    return kind == 'users' and import_pool.pending > 0
+
+
+async def get_user_records(users: list[json_schemes.UserImport]) -> list[tuple]:
+    hashes = await hash_passwords([user.password for user in users])
+    now = datetime.now(timezone.utc)
+    return [(user.guid or uuid.uuid4(), user.email, user.first_name, user.last_name, hashed,
+             user.is_verified, True, user.roles, user.created_at or now)
+            for user, hashed in zip(users, hashes)]
+
+
+def get_tweet_records(tweets: list[json_schemes.TweetImport]) -> list[tuple]:
+    now = datetime.now(timezone.utc)
+    return [(tweet.guid or uuid.uuid4(), tweet.message, tweet.created_by_guid, tweet.created_at or now,
+             tweet.is_deleted)
+            for tweet in tweets]
+
+
+async def import_records(async_session: AsyncSession, kind: str,
+                         records: Iterable[tuple[int, Optional[dict]]]) -> AsyncIterator[json_schemes.ImportProgress]:
+    """
+    Validates records with json_schemes models and loads them with COPY,
+    IMPORT_BATCH_SIZE at a time, committing every batch. Only one batch is held in memory.
+    Records are read in a thread, so a file being read does not block the event loop.
+    A batch the database rejects (e.g. a duplicated email) or that finds the import pool busy
+    is skipped as a whole.
+    Yields progress after every batch.
+    """
+    schema = json_schemes.UserImport if kind == 'users' else json_schemes.TweetImport
+    batches = batched(records, settings.IMPORT_BATCH_SIZE)
+    batch_no = 0
+    while batch := await asyncio.to_thread(next, batches, None):
+        start = time.perf_counter()
+        rows, errors = [], []
+        for line, record in batch:
+            if record is None:
+                errors.append(json_schemes.ImportRowError(line=line, error='Malformed record'))
+                continue
+            try:
+                rows.append(schema.parse_obj(record))
+            except pydantic.ValidationError as e:
+                errors.append(json_schemes.ImportRowError(line=line, error=str(e)))
+
+        imported = 0
+        if rows:
+            try:
+                if kind == 'users':
+                    await bulk_repo.copy_users(async_session, await get_user_records(rows))
+                    await counter_repo.increment(async_session, counter_repo.USERS, len(rows))
+                else:
+                    await bulk_repo.copy_tweets(async_session, get_tweet_records(rows))
+                    await counter_repo.increment(async_session, counter_repo.TWEETS,
+                                                 sum(not tweet.is_deleted for tweet in rows))
+                await async_session.commit()
+                imported = len(rows)
+            except (asyncpg.PostgresError, sqlalchemy.exc.DBAPIError, PoolOverloaded) as e:
+                await async_session.rollback()
+                errors.insert(0, json_schemes.ImportRowError(line=batch[0][0], error=f'Batch rejected: {e}'))
+
+        yield json_schemes.ImportProgress(batch=batch_no,
+                                          imported=imported,
+                                          rejected=len(batch) - imported,
+                                          errors=errors[:MAX_ERRORS_PER_BATCH],
+                                          seconds=time.perf_counter() - start)
+        batch_no += 1
+
+
+async def import_file(kind: str, path: str, fmt: str):
+    imported = rejected = 0
+    async with AsyncMainSession() as async_session:
+        with open(path, encoding='utf-8', newline='') as file:
+            async for progress in import_records(async_session, kind, iter_records(file, fmt)):
+                imported += progress.imported
+                rejected += progress.rejected
+                print(progress.json())
+    import_pool.shutdown()
+    print(f'Imported {imported} {kind}, rejected {rejected}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk import of users or tweets')
+    parser.add_argument('kind', choices=KINDS)
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default=None,
+                        help='Taken from the file extension by default')
+    args = parser.parse_args()
+    asyncio.run(import_file(args.kind, args.path, args.format or get_format(args.path)))
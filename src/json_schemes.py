@@ -1,7 +1,7 @@
 import datetime
-from typing import Optional
+from typing import Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
 import uuid
 
 
@@ -22,6 +22,21 @@ class UserCreate(BaseModel):
     password: str
 
 
+class UserImport(UserCreate):
+    guid: Optional[uuid.UUID]
+    last_name: Optional[str]
+    is_verified: bool = False
+    roles: list[str] = ['reader']
+    created_at: Optional[datetime.datetime]
+
+    @validator('roles', pre=True)
+    def split_roles(cls, roles):
+        # CSV keeps roles as a comma separated string
+        if isinstance(roles, str):
+            return [role for role in roles.split(',') if role]
+        return roles
+
+
 class UserGUID(BaseModel):
     user_guid: uuid.UUID
 
@@ -31,15 +46,59 @@ class UserRead(BaseORM):
     email: Optional[str]
     roles: list[str]
     photo_url: Optional[str]
+    photo_urls: Optional[dict[str, str]]
     first_name: Optional[str]
     last_name: Optional[str]
     is_verified: bool
 
 
+class Principal(UserRead):
+    """
+    Current user built from verified access token claims without a database lookup
+    """
+    is_verified: bool = True
+    version: int = 1
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> 'Principal':
+        return cls(guid=claims['sub'],
+                   email=claims.get('email'),
+                   roles=claims.get('roles') or [],
+                   photo_url=claims.get('photo_url'),
+                   photo_urls=claims.get('photo_urls'),
+                   first_name=claims.get('first_name'),
+                   last_name=claims.get('last_name'),
+                   is_verified=claims.get('is_verified', True),
+                   version=claims.get('version', 1),
+                   )
+
+
 class SuperuserUserUpdate(BaseModel):
     roles: list[str]
 
 
+class BulkUsersFilter(BaseModel):
+    """
+    Selects users either by guid or by search, like in GET /superuser/users
+    """
+    guids: Optional[list[uuid.UUID]]
+    search: Optional[str]
+
+
+class BulkUsersUpdate(BulkUsersFilter):
+    roles: list[str]
+
+
+class BatchResult(BaseModel):
+    rows: int
+    seconds: float
+
+
+class BulkResult(BaseModel):
+    rows: int
+    batches: list[BatchResult]
+
+
 class UserUpdate(BaseModel):
     email: Optional[str]
     first_name: Optional[str]
@@ -71,5 +130,68 @@ class Tweet(BaseORM):
     created_at: datetime.datetime
 
 
+class Total(BaseModel):
+    value: int
+    # exact comes from row_counters, estimate from the query planner
+    kind: Literal['exact', 'estimate']
+
+
+class TweetPage(BaseModel):
+    items: list[Tweet]
+    next_cursor: Optional[str]
+    total: Optional[Total]
+
+
+class CompactTweet(BaseModel):
+    guid: uuid.UUID
+    message: str
+    created_by_guid: uuid.UUID
+    created_at: datetime.datetime
+
+
+class CompactFeed(BaseModel):
+    tweets: list[CompactTweet]
+    authors: dict[str, UserRead]
+    next_cursor: Optional[str]
+    total: Optional[Total]
+
+
+class UserPage(BaseModel):
+    items: list[UserRead]
+    total: Total
+
+
 class CreateTweet(BaseModel):
     message: str
+
+
+class UserExport(UserRead):
+    created_at: datetime.datetime
+
+
+class TweetExport(BaseORM):
+    guid: uuid.UUID
+    message: str
+    created_by_guid: Optional[uuid.UUID]
+    created_at: datetime.datetime
+    is_deleted: bool
+
+
+class TweetImport(CreateTweet):
+    guid: Optional[uuid.UUID]
+    created_by_guid: uuid.UUID
+    created_at: Optional[datetime.datetime]
+    is_deleted: bool = False
+
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportProgress(BaseModel):
+    batch: int
+    imported: int
+    rejected: int
+    errors: list[ImportRowError]
+    seconds: float
@@ -0,0 +1,186 @@
+"""
+Manages the monthly partitions of the tweets table.
+The app creates partitions ahead on startup, the same is done from the command line (e.g. by a cron job):
+    python -m src.partitions ensure
+Old months are removed without a bulk DELETE by detaching (the table is kept, e.g. to be archived)
+or dropping their partitions:
+    python -m src.partitions detach --before 2025-01
+    python -m src.partitions drop --before 2025-01
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import re
+
+import sqlalchemy.exc
+from prometheus_client import Gauge
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from conf import settings
+from src.repo import counter as counter_repo
+from utils.db_connection import AsyncMainSession
+
+logger = logging.getLogger('partitions')
+
+TABLE = 'tweets'
+# Catches tweets of months without a partition, see db_models
+DEFAULT_PARTITION = f'{TABLE}_default'
+PARTITION_NAME = re.compile(rf'^{TABLE}_y(\d{{4}})m(\d{{2}})$')
+# Serializes partition management between app instances starting at the same time
+LOCK_KEY = 7_020_001
+
+DEFAULT_PARTITION_ROWS = Gauge('tweets_default_partition_rows',
+                               'Tweets in the default partition, left there when their month has no partition')
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(month: datetime.date) -> str:
+    return f'{TABLE}_y{month.year}m{month.month:02d}'
+
+
+def get_partition_month(name: str) -> datetime.date | None:
+    match = PARTITION_NAME.match(name)
+    if match is None:
+        return None
+    return datetime.date(int(match.group(1)), int(match.group(2)), 1)
+
+
+async def create_partition(async_session: AsyncSession, month: datetime.date):
+    """
+    Creates the partition of the month where it is missing.
+    Tweets of the month already in the default partition would make creating it fail, so they are moved into it
+    """
+    name = get_partition_name(month)
+    exists_resp = await async_session.execute(text('SELECT to_regclass(:name) IS NOT NULL'), {'name': name})
+    if exists_resp.scalar_one():
+        return
+    start = f"'{month.isoformat()} 00:00:00+00'"
+    end = f"'{add_months(month, 1).isoformat()} 00:00:00+00'"
+    await async_session.execute(text(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+    moved_resp = await async_session.execute(text(
+        f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= {start} AND created_at < {end} '
+        f'RETURNING *) INSERT INTO {name} SELECT * FROM moved'
+    ))
+    if moved_resp.rowcount:
+        logger.warning(f"Moved {moved_resp.rowcount} tweets from {DEFAULT_PARTITION} to {name}")
+    await async_session.execute(text(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM ({start}) TO ({end})'))
+
+
+async def ensure_partitions(async_session: AsyncSession, months_ahead: int = settings.TWEET_PARTITIONS_AHEAD):
+    """
+    Creates partitions from the current month up to months_ahead months later, where they are missing,
+    and reports the tweets left in the default partition (e.g. imported into months not covered) to
+    tweets_default_partition_rows
+    """
+    await async_session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': LOCK_KEY})
+    current = datetime.datetime.now(datetime.timezone.utc).date().replace(day=1)
+    for months in range(months_ahead + 1):
+        await create_partition(async_session, add_months(current, months))
+    count_resp = await async_session.execute(text(f'SELECT count(*) FROM {DEFAULT_PARTITION}'))
+    await async_session.commit()
+    default_rows = count_resp.scalar_one()
+    DEFAULT_PARTITION_ROWS.set(default_rows)
+    if default_rows:
+        logger.warning(f"{default_rows} tweets are in {DEFAULT_PARTITION}, their months have no partition")
+
+
+async def get_attached_months(async_session: AsyncSession) -> list[datetime.date]:
+    partitions_resp = await async_session.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+    ), {'table': TABLE})
+    months = [get_partition_month(name) for name in partitions_resp.scalars()]
+    return sorted(month for month in months if month is not None)
+
+
+async def get_detached_months(async_session: AsyncSession) -> list[datetime.date]:
+    tables_resp = await async_session.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition AND relname LIKE :pattern"
+    ), {'pattern': f'{TABLE}_y%'})
+    months = [get_partition_month(name) for name in tables_resp.scalars()]
+    return sorted(month for month in months if month is not None)
+
+
+async def detach_partition(async_session: AsyncSession, month: datetime.date):
+    """
+    Turns the partition into a standalone table, its tweets disappear from the app.
+    Takes a short exclusive lock on tweets
+    """
+    name = get_partition_name(month)
+    count_resp = await async_session.execute(text(f'SELECT count(*) FROM {name} WHERE is_deleted = false'))
+    await async_session.execute(text(f'ALTER TABLE {TABLE} DETACH PARTITION {name}'))
+    await counter_repo.increment(async_session, counter_repo.TWEETS, -count_resp.scalar_one())
+
+
+async def detach_partitions_before(async_session: AsyncSession, before: datetime.date) -> list[str]:
+    """
+    Detaches partitions of the months before `before`, committing each
+    :return: names of the detached tables
+    """
+    detached = []
+    for month in await get_attached_months(async_session):
+        if month >= before:
+            break
+        await detach_partition(async_session, month)
+        await async_session.commit()
+        detached.append(get_partition_name(month))
+    return detached
+
+
+async def drop_partitions_before(async_session: AsyncSession, before: datetime.date) -> list[str]:
+    """
+    Drops partitions of the months before `before`, previously detached ones included
+    :return: names of the dropped tables
+    """
+    await detach_partitions_before(async_session, before)
+    dropped = []
+    for month in await get_detached_months(async_session):
+        if month >= before:
+            break
+        await async_session.execute(text(f'DROP TABLE {get_partition_name(month)}'))
+        await async_session.commit()
+        dropped.append(get_partition_name(month))
+    return dropped
+
+
+async def ensure_partitions_on_startup():
+    """
+    The app starts without the partitions if the database is unreachable, the cron job creates them later
+    """
+    try:
+        async with AsyncMainSession() as async_session:
+            await ensure_partitions(async_session)
+    except (sqlalchemy.exc.DBAPIError, OSError, asyncio.TimeoutError):
+        logger.exception("Failed to create tweets partitions")
+
+
+async def run(command: str, before: datetime.date | None):
+    async with AsyncMainSession() as async_session:
+        if command == 'ensure':
+            await ensure_partitions(async_session)
+            print(f'Partitions: {[get_partition_name(month) for month in await get_attached_months(async_session)]}')
+        elif command == 'detach':
+            print(f'Detached: {await detach_partitions_before(async_session, before)}')
+        else:
+            print(f'Dropped: {await drop_partitions_before(async_session, before)}')
+
+
+def parse_month(value: str) -> datetime.date:
+    return datetime.datetime.strptime(value, '%Y-%m').date()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Monthly partitions of the tweets table')
+    parser.add_argument('command', choices=('ensure', 'detach', 'drop'))
+    parser.add_argument('--before', type=parse_month, help='YYYY-MM, first month to keep')
+    args = parser.parse_args()
+    if args.command != 'ensure' and args.before is None:
+        parser.error(f'{args.command} requires --before')
+    asyncio.run(run(args.command, args.before))
@@ -0,0 +1,41 @@
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from conf import settings
+from utils.workers import BoundedProcessPool, PoolOverloaded
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt takes hundreds of milliseconds of CPU, so it never runs on the event loop
+password_pool = BoundedProcessPool('password',
+                                   max_workers=settings.PASSWORD_POOL_WORKERS,
+                                   max_queue=settings.PASSWORD_POOL_QUEUE)
+
+
+def hash_password_sync(password):
+    return pwd_context.hash(password)
+
+
+def verify_password_sync(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def hash_passwords_sync(passwords: list[str]) -> list[str]:
+    return [pwd_context.hash(password) for password in passwords]
+
+
+async def _run(fn, *args):
+    try:
+        return await password_pool.run(fn, *args)
+    except PoolOverloaded:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Too many password operations in progress. Try again later.",
+                            headers={"Retry-After": "1"})
+
+
+async def verify_password(plain_password, hashed_password) -> bool:
+    return await _run(verify_password_sync, plain_password, hashed_password)
+
+
+async def get_password_hash(password) -> str:
+    return await _run(hash_password_sync, password)
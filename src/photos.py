@@ -0,0 +1,46 @@
+import logging
+import uuid
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from conf import settings
+from src.repo import user as user_repo
+from utils import images
+from utils.db_connection import AsyncMainSession
+from utils.s3 import S3StorageBase
+from utils.workers import BoundedProcessPool
+
+logger = logging.getLogger('photos')
+
+photo_pool = BoundedProcessPool('photos',
+                                max_workers=settings.PHOTO_POOL_WORKERS,
+                                max_queue=settings.PHOTO_POOL_QUEUE)
+
+
+def get_variant_path(original_path: str, variant: str) -> str:
+    return f'{original_path}_{variant}.{images.EXTENSION}'
+
+
+async def make_photo_variants(s3: S3StorageBase, user_guid: uuid.UUID, original_path: str,
+                              session_maker: async_sessionmaker = AsyncMainSession):
+    """
+    Background task run after an upload: resizes the original into settings.PHOTO_SIZES in the photo pool,
+    stores the variants next to it and saves their urls to the user.
+    If it fails the user keeps the original photo_url only.
+    """
+    try:
+        data = await s3.read_bytes(original_path)
+        variants = await photo_pool.run(images.make_derivatives, data, settings.PHOTO_SIZES)
+        photo_urls = {}
+        for name, content in variants.items():
+            path = get_variant_path(original_path, name)
+            await s3.put_bytes(path, content, images.CONTENT_TYPE)
+            photo_urls[name] = s3.get_file_url(path)
+    except Exception:
+        logger.exception(f"Failed to make photo variants for {original_path}")
+        return
+
+    async with session_maker() as async_session:
+        await user_repo.set_photo_urls(async_session, user_guid,
+                                       original_url=s3.get_file_url(original_path), photo_urls=photo_urls)
+        await async_session.commit()
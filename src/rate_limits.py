@@ -0,0 +1,40 @@
+from typing import Optional
+
+from conf import settings
+from src.auth import decode_token
+from utils.rate_limit import RatePolicy, TokenBucketBackend, InMemoryTokenBuckets, RedisTokenBuckets
+
+
+def get_rate_limit_backend() -> TokenBucketBackend:
+    if settings.RATE_LIMIT_BACKEND == 'redis':
+        return RedisTokenBuckets(settings.REDIS_URL)
+    return InMemoryTokenBuckets(shards=settings.RATE_LIMIT_SHARDS, max_keys=settings.RATE_LIMIT_MAX_KEYS)
+
+
+rate_limit_backend: TokenBucketBackend = get_rate_limit_backend()
+
+# Endpoints doing a password hash or a commit per request
+POLICIES = {
+    '/auth/login/email': [
+        RatePolicy('login_ip', per_minute=settings.LOGIN_IP_PER_MINUTE, burst=settings.LOGIN_IP_BURST),
+        # Slows down guessing the password of one account from many addresses
+        RatePolicy('login_email', per_minute=settings.LOGIN_EMAIL_PER_MINUTE, burst=settings.LOGIN_EMAIL_BURST,
+                   key='body', field='username'),
+    ],
+    '/auth/register': [
+        RatePolicy('register_ip', per_minute=settings.REGISTER_IP_PER_MINUTE, burst=settings.REGISTER_IP_BURST),
+    ],
+    '/user/change_password': [
+        RatePolicy('change_password_user', per_minute=settings.CHANGE_PASSWORD_USER_PER_MINUTE,
+                   burst=settings.CHANGE_PASSWORD_USER_BURST, key='user'),
+    ],
+    '/tweets/new': [
+        RatePolicy('new_tweet_user', per_minute=settings.NEW_TWEET_USER_PER_MINUTE,
+                   burst=settings.NEW_TWEET_USER_BURST, key='user'),
+    ],
+}
+
+
+def get_user_guid(token: str) -> Optional[str]:
+    # Verified claims are cached, so repeated tokens cost a dict lookup
+    return decode_token(token).get('sub')
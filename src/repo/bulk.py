@@ -0,0 +1,28 @@
+from typing import List, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+USER_COLUMNS = ('guid', 'email', 'first_name', 'last_name', 'password',
+                'is_verified', 'is_active', 'roles', 'created_at')
+TWEET_COLUMNS = ('guid', 'message', 'created_by_guid', 'created_at', 'is_deleted')
+
+
+async def copy_records(async_session: AsyncSession, table: str, columns: Sequence[str], records: List[tuple]):
+    """
+    Loads records with a single COPY, as part of the session transaction.
+    Records must hold values for `columns` in that order, server defaults are not applied.
+    """
+    # The driver connection joins the session transaction only once a statement was run through it
+    await async_session.execute(text('SELECT 1'))
+    connection = await async_session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(table, records=records, columns=columns)
+
+
+async def copy_users(async_session: AsyncSession, records: List[tuple]):
+    await copy_records(async_session, 'users', USER_COLUMNS, records)
+
+
+async def copy_tweets(async_session: AsyncSession, records: List[tuple]):
+    await copy_records(async_session, 'tweets', TWEET_COLUMNS, records)
@@ -0,0 +1,74 @@
+import json
+import random
+from typing import Literal, Optional
+
+from sqlalchemy import Select, select, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from conf import settings
+from src import db_models as models
+from src import json_schemes
+
+# Users, all of them
+USERS = 'users'
+# Tweets that are not deleted
+TWEETS = 'tweets'
+
+
+async def increment(async_session: AsyncSession, name: str, delta: int):
+    """
+    Adds delta to a random shard of the counter, as part of the session transaction
+    """
+    if delta == 0:
+        return
+    statement = insert(models.RowCounter).values(name=name, shard=random.randrange(settings.COUNTER_SHARDS),
+                                                 count=delta)
+    statement = statement.on_conflict_do_update(index_elements=[models.RowCounter.name, models.RowCounter.shard],
+                                                set_={'count': models.RowCounter.count + statement.excluded.count})
+    await async_session.execute(statement)
+
+
+async def get_count(async_session: AsyncSession, name: str) -> int:
+    count_resp = await async_session.execute(select(func.coalesce(func.sum(models.RowCounter.count), 0))
+                                             .filter_by(name=name))
+    return int(count_resp.scalar_one())
+
+
+class Explain(Executable, ClauseElement):
+    """
+    EXPLAIN (FORMAT JSON) of a select, compiled with it so its parameters stay bound parameters
+    """
+    inherit_cache = False
+
+    def __init__(self, query: Select):
+        self.query = query
+
+
+@compiles(Explain, 'postgresql')
+def compile_explain(element: Explain, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.query, **kw)
+
+
+async def get_estimated_count(async_session: AsyncSession, query: Select) -> int:
+    """
+    Number of rows the planner expects `query` to return, from table statistics and without running it
+    """
+    plan_resp = await async_session.execute(Explain(query))
+    plan = plan_resp.scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+async def get_total(async_session: AsyncSession, name: Optional[str], query: Select,
+                    kind: Literal['exact', 'estimate']) -> json_schemes.Total:
+    """
+    :param name: counter holding the number of rows `query` returns, None if there is no such counter
+    (e.g. the query is filtered), then an estimate is returned whatever kind is asked for
+    """
+    if kind == 'exact' and name is not None:
+        return json_schemes.Total(value=await get_count(async_session, name), kind='exact')
+    return json_schemes.Total(value=await get_estimated_count(async_session, query), kind='estimate')
@@ -0,0 +1,33 @@
+from typing import List
+
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src import db_models
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+
+
+async def enqueue_email(async_session: AsyncSession, to: str, subject: str, message_text: str):
+    """
+    Adds an email to the outbox. It is sent by src.email_worker once the caller commits,
+    so it is written in the same transaction as the rest of the request.
+    """
+    async_session.add(db_models.EmailOutbox(recipient=to, subject=subject, message_text=message_text,
+                                            status=PENDING))
+
+
+async def claim_pending(async_session: AsyncSession, batch_size: int) -> List[db_models.EmailOutbox]:
+    """
+    Locks up to batch_size emails that are due. Rows locked by other workers are skipped,
+    the locks are held until the caller commits.
+    """
+    query = select(db_models.EmailOutbox) \
+        .filter(db_models.EmailOutbox.status == PENDING, db_models.EmailOutbox.next_attempt_at <= func.now()) \
+        .order_by(db_models.EmailOutbox.next_attempt_at) \
+        .limit(batch_size) \
+        .with_for_update(skip_locked=True)
+    emails_resp = await async_session.execute(query)
+    return list(emails_resp.scalars().all())
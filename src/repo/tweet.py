@@ -1,27 +1,99 @@
-from typing import List
+import datetime
+import uuid
+from typing import AsyncIterator, List, Optional
 
-from sqlalchemy import select
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select, delete, tuple_, func, lambda_stmt, false
+from sqlalchemy.orm import joinedload, noload
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src import db_models
 from src import json_schemes
+from src import feed_cache
+from src.repo import counter as counter_repo
 
+# Notified with the guid of every new tweet
+TWEETS_CHANNEL = 'tweets'
 
-async def get_tweets(async_session: AsyncSession, page: int, limit: int) -> List[db_models.Tweet]:
-    query = select(db_models.Tweet).options(joinedload(db_models.Tweet.created_by)) \
-        .filter_by(is_deleted=False).order_by(db_models.Tweet.created_at.desc())
-    if page is not None and limit is not None:
-        query = query.limit(limit).offset((page - 1) * limit)
+
+async def get_tweets(async_session: AsyncSession, page: Optional[int], limit: Optional[int],
+                     after: Optional[tuple[datetime.datetime, uuid.UUID]] = None,
+                     created_by_guid: Optional[uuid.UUID] = None) -> List[db_models.Tweet]:
+    """
+    Returns the feed newest first, only tweets of created_by_guid if given.
+    If `after` (created_at, guid) is given, returns tweets strictly older than it (keyset pagination),
+    which is served from ix_tweets_feed (ix_tweets_author_feed for one author) at any depth.
+    Otherwise `page` is used as an offset.
+    The statement is composed of lambdas, each part is built and cache keyed once, not on every call.
+    """
+    query = lambda_stmt(lambda: select(db_models.Tweet).options(joinedload(db_models.Tweet.created_by))
+                        .filter_by(is_deleted=False)
+                        .order_by(db_models.Tweet.created_at.desc(), db_models.Tweet.guid.desc()))
+    if created_by_guid is not None:
+        query += lambda s: s.filter(db_models.Tweet.created_by_guid == created_by_guid)
+    if after is not None:
+        after_created_at, after_guid = after
+        # The row comparison alone does not let the planner prune tweets partitions newer than the cursor
+        query += lambda s: s.filter(tuple_(db_models.Tweet.created_at, db_models.Tweet.guid)
+                                    < tuple_(after_created_at, after_guid),
+                                    db_models.Tweet.created_at <= after_created_at)
+    if limit is not None:
+        query += lambda s: s.limit(limit)
+        if page is not None:
+            offset = (page - 1) * limit
+            query += lambda s: s.offset(offset)
     tweets_resp = await async_session.execute(query)
     tweets = list(tweets_resp.scalars().unique().all())
     return tweets
 
 
+def get_count_query():
+    return select(db_models.Tweet.guid).filter_by(is_deleted=False)
+
+
+async def stream_tweets(async_session: AsyncSession, batch_size: int) -> AsyncIterator[db_models.Tweet]:
+    """
+    Yields all tweets, deleted ones included, oldest first,
+    fetching them batch_size at a time through a server side cursor
+    """
+    tweets_resp = await async_session.stream_scalars(select(db_models.Tweet)
+                                                     .options(noload(db_models.Tweet.created_by))
+                                                     .order_by(db_models.Tweet.created_at)
+                                                     .execution_options(yield_per=batch_size))
+    async for tweet in tweets_resp:
+        yield tweet
+
+
+async def delete_users_tweets(async_session: AsyncSession, user_guids: List[uuid.UUID]) -> int:
+    """
+    Deletes all tweets of the users, soft-deleted ones included, so the users themselves can be deleted.
+    The feed cache is left for the caller to invalidate once committed
+    :return: number of deleted tweets that were not soft-deleted
+    """
+    deleted = (delete(db_models.Tweet).where(db_models.Tweet.created_by_guid.in_(user_guids))
+               .returning(db_models.Tweet.is_deleted).cte('deleted'))
+    count_resp = await async_session.execute(select(func.count()).select_from(deleted)
+                                             .where(deleted.c.is_deleted == false()))
+    count = count_resp.scalar_one()
+    await counter_repo.increment(async_session, counter_repo.TWEETS, -count)
+    return count
+
+
+async def get_tweet(async_session: AsyncSession, guid) -> Optional[db_models.Tweet]:
+    tweet_resp = await async_session.execute(select(db_models.Tweet)
+                                             .options(joinedload(db_models.Tweet.created_by))
+                                             .filter_by(guid=guid, is_deleted=False))
+    return tweet_resp.scalars().one_or_none()
+
+
 async def new_tweet(async_session: AsyncSession, creator, tweet_create: json_schemes.CreateTweet):
     tweet = db_models.Tweet(
+        guid=uuid.uuid4(),
         message=tweet_create.message,
         created_by_guid=creator.guid,
     )
     async_session.add(tweet)
+    # Postgres delivers the notification only once the transaction commits
+    await async_session.execute(select(func.pg_notify(TWEETS_CHANNEL, str(tweet.guid))))
+    await counter_repo.increment(async_session, counter_repo.TWEETS, 1)
     await async_session.commit()
+    await feed_cache.invalidate()
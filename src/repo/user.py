@@ -1,64 +1,115 @@
-from typing import List
+import uuid
+from typing import AsyncIterator, List
 from typing import Optional
 
 import fastapi
 from fastapi import HTTPException
-from sqlalchemy import select, delete, update, func
+from sqlalchemy import select, delete, update, func, lambda_stmt
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 import src.db_models as models
 from src.utils import make_search_query
+from src.repo import counter as counter_repo
+from src.repo import tweet as tweet_repo
 
 
 async def get_user(async_session: AsyncSession, tg_id=None, user_guid=None, email=None) -> Optional[
     models.User]:
+    """
+    Statements are lambdas, built and cache keyed once per call site instead of on every call
+    """
     if tg_id is None and user_guid is None and email is None:
         raise fastapi.HTTPException(status_code=fastapi.status.HTTP_500_INTERNAL_SERVER_ERROR,
                                     detail="no identity specified")
 
-    if tg_id is not None:
-        query = select(models.User).filter_by(tg_id=tg_id).limit(1)
-    if user_guid is not None:
-        query = select(models.User).filter_by(guid=user_guid).limit(1)
     if email is not None:
-        query = select(models.User).filter_by(email=email).limit(1)
+        query = lambda_stmt(lambda: select(models.User).where(models.User.email == email).limit(1))
+    elif user_guid is not None:
+        query = lambda_stmt(lambda: select(models.User).where(models.User.guid == user_guid).limit(1))
+    else:
+        query = lambda_stmt(lambda: select(models.User).where(models.User.tg_id == tg_id).limit(1))
 
     user_query_exec = await async_session.execute(query)
     user = user_query_exec.scalars().one_or_none()
     return user
 
 
-async def check_is_user_exists(async_session, user_create):
-    user_query_exec = await async_session.execute(select(models.User)
-                                                  .filter((models.User.email == user_create.email)).limit(1))
-    user = user_query_exec.scalars().first()
-    return user is not None
-
-
 async def new_user(async_session, user):
     async_session.add(user)
+    await counter_repo.increment(async_session, counter_repo.USERS, 1)
     return user
 
 
+async def insert_user(async_session: AsyncSession, **values) -> Optional[uuid.UUID]:
+    """
+    Inserts the user in one statement, unless the email is taken
+    :return: guid of the new user, None if a user with the email exists
+    """
+    insert_resp = await async_session.execute(insert(models.User).values(**values)
+                                              .on_conflict_do_nothing(index_elements=[models.User.email])
+                                              .returning(models.User.guid))
+    guid = insert_resp.scalar_one_or_none()
+    if guid is not None:
+        await counter_repo.increment(async_session, counter_repo.USERS, 1)
+    return guid
+
+
+async def upsert_tg_user(async_session: AsyncSession, tg_id: str, **values) -> tuple[models.User, bool]:
+    """
+    Returns the user with tg_id, creating it with `values` if there is none.
+    The insert does nothing if the tg_id is taken, the existing user is then selected, so logins of existing users
+    write nothing. Concurrent first logins of one tg_id still end up with a single user.
+    :return: the user and whether it was created
+    """
+    insert_resp = await async_session.execute(insert(models.User).values(tg_id=tg_id, **values)
+                                              .on_conflict_do_nothing(index_elements=[models.User.tg_id])
+                                              .returning(models.User)
+                                              .execution_options(populate_existing=True))
+    user = insert_resp.scalar_one_or_none()
+    if user is not None:
+        await counter_repo.increment(async_session, counter_repo.USERS, 1)
+        return user, True
+    return await get_user(async_session, tg_id=tg_id), False
+
+
 async def verify_user(async_session, user_guid):
-    user_query_exec = await async_session.execute(select(models.User).filter_by(guid=user_guid).limit(1))
-    user = user_query_exec.scalars().one_or_none()
-    if user is None:
+    verify_resp = await async_session.execute(update(models.User).where(models.User.guid == user_guid)
+                                              .values(is_verified=True).returning(models.User.guid))
+    if verify_resp.scalar_one_or_none() is None:
         raise HTTPException(status_code=404)
-    user.is_verified = True
+
+
+SEARCH_CONFIG = 'simple'
+
+
+def get_search_query(search: str):
+    return func.to_tsquery(SEARCH_CONFIG, make_search_query(search))
+
+
+def get_search_filter(search: str):
+    return models.User.search_vector.op('@@')(get_search_query(search))
+
+
+def get_count_query(search: Optional[str]):
+    query = select(models.User.guid)
+    if search is not None and search != '':
+        query = query.filter(get_search_filter(search))
+    return query
 
 
 async def get_users(async_session: AsyncSession, search: Optional[str], page: int, limit: int) -> List[models.User]:
-    query = select(models.User).order_by(models.User.created_at.desc())
+    """
+    Returns users newest first. With `search` only users matching it by name or email are returned,
+    best matches first. The search uses the GIN index on users.search_vector
+    """
+    query = select(models.User)
     if search is not None and search != '':
-        query = query.filter(
-            func.to_tsvector(func.coalesce(models.User.first_name, '') + ' '
-                             + func.coalesce(models.User.last_name, '') + ' '
-                             + func.coalesce(models.User.email, '')
-                             )
-            .op('@@')(
-                func.to_tsquery(make_search_query(search)))
-        )
+        ts_query = get_search_query(search)
+        query = query.filter(get_search_filter(search)) \
+            .order_by(func.ts_rank(models.User.search_vector, ts_query).desc(), models.User.created_at.desc())
+    else:
+        query = query.order_by(models.User.created_at.desc())
     if page is not None and limit is not None:
         query = query.limit(limit).offset((page - 1) * limit)
     users_resp = await async_session.execute(query)
@@ -67,7 +118,9 @@ async def get_users(async_session: AsyncSession, search: Optional[str], page: in
 
 
 async def delete_user(async_session: AsyncSession, delete_user_id: str):
-    await async_session.execute(delete(models.User).where(models.User.guid == delete_user_id))
+    await tweet_repo.delete_users_tweets(async_session, [delete_user_id])
+    result = await async_session.execute(delete(models.User).where(models.User.guid == delete_user_id))
+    await counter_repo.increment(async_session, counter_repo.USERS, -result.rowcount)
 
 
 async def update_user(async_session: AsyncSession, update_user_id: str, new_user_params):
@@ -75,5 +128,51 @@ async def update_user(async_session: AsyncSession, update_user_id: str, new_user
                                 .values(**new_user_params.dict()))
 
 
+async def stream_users(async_session: AsyncSession, batch_size: int) -> AsyncIterator[models.User]:
+    """
+    Yields all users oldest first, fetching them batch_size at a time through a server side cursor
+    """
+    users_resp = await async_session.stream_scalars(select(models.User).order_by(models.User.created_at)
+                                                    .execution_options(yield_per=batch_size))
+    async for user in users_resp:
+        yield user
+
+
+async def get_user_guids(async_session: AsyncSession, search: str, after_guid: Optional[uuid.UUID],
+                         limit: int) -> List[uuid.UUID]:
+    """
+    Returns guids of users matching the search in guid order, starting after `after_guid`
+    """
+    query = select(models.User.guid).filter(get_search_filter(search)).order_by(models.User.guid).limit(limit)
+    if after_guid is not None:
+        query = query.filter(models.User.guid > after_guid)
+    guids_resp = await async_session.execute(query)
+    return list(guids_resp.scalars().all())
+
+
+async def delete_users(async_session: AsyncSession, guids: List[uuid.UUID]) -> int:
+    """
+    Deletes the users together with their tweets
+    :return: number of deleted users
+    """
+    await tweet_repo.delete_users_tweets(async_session, guids)
+    result = await async_session.execute(delete(models.User).where(models.User.guid.in_(guids)))
+    await counter_repo.increment(async_session, counter_repo.USERS, -result.rowcount)
+    return result.rowcount
+
+
+async def update_users(async_session: AsyncSession, guids: List[uuid.UUID], new_user_params) -> int:
+    result = await async_session.execute(update(models.User).where(models.User.guid.in_(guids))
+                                         .values(**new_user_params.dict()))
+    return result.rowcount
+
+
+async def set_photo_urls(async_session: AsyncSession, user_guid, original_url: str, photo_urls: dict[str, str]):
+    # Only if the photo was not replaced while its variants were being made
+    await async_session.execute(update(models.User)
+                                .where(models.User.guid == user_guid, models.User.photo_url == original_url)
+                                .values(photo_urls=photo_urls))
+
+
 async def set_user_recovery_token(async_session: AsyncSession, email: str):
     await async_session.execute()
@@ -1,5 +1,6 @@
 import hashlib
 import hmac
+import uuid
 from copy import copy
 from datetime import datetime, timedelta, timezone
 from typing import Dict, Any, Annotated
@@ -8,21 +9,21 @@ from typing import Union
 from fastapi import APIRouter, Response, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from jose import jwt
-from passlib.context import CryptContext
 
 from conf import settings
 from conf.secrets import PASSWORD_ENCODING_SECRET
 from conf.secrets import tg_secret_token
 from src.db_models import User
-from src.dependencies import AsyncSessionDep, EmailSenderDep
+from src.dependencies import AsyncSessionDep, AsyncReadSessionDep
 from src.json_schemes import UserCreate, UserRead, UserGUID, Token
+from src.passwords import verify_password, get_password_hash
 from src.repo import user as user_repo
+from src.repo import outbox as outbox_repo
 from src.roles import Role
 from .email_template import registration_template
 from ..auth import get_user_from_refresh_token
 
 auth_router = APIRouter()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def create_jwt_token(data: dict, expires_delta: timedelta | None = None):
@@ -36,14 +37,6 @@ def create_jwt_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-
 def get_data_string(data: dict):
     sorted_data = sorted(data.items(), key=lambda x: x[0])
     sorted_data_str = '\n'.join([f'{key}={val}' for key, val in sorted_data])
@@ -63,7 +56,7 @@ async def authenticate_user(async_session, email: str, password: str) -> Union[U
     user = await user_repo.get_user(async_session, email=email)
     if user is None:
         return False
-    if not verify_password(password, user.password):
+    if not await verify_password(password, user.password):
         return False
     return user
 
@@ -84,6 +77,9 @@ def get_jwt_tokens(user: User, response: Response) -> Token:
         "email": user.email,
         "roles": user.roles,
         "photo_url": user.photo_url,
+        "photo_urls": user.photo_urls,
+        "is_verified": user.is_verified,
+        "version": user.version,
     }, expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES))
 
     return Token(access_token=access_token, token_type="Bearer")
@@ -129,23 +125,21 @@ async def auth_tg(response: Response, async_session: AsyncSessionDep, request: D
     photo_url = request.get('photo_url')
     first_name = request.get('first_name')
     last_name = request.get('last_name')
-    user = await user_repo.get_user(async_session, tg_id=tg_id)
-    if user is None:
-        user = User(first_name=first_name,
-                    last_name=last_name,
-                    email=None,
-                    password=None,
-                    tg_id=tg_id,
-                    tg_username=username,
-                    is_active=True,
-                    photo_url=photo_url,
-                    roles=[Role.Reader.value],
-                    is_verified=True
-                    )
-        user = await user_repo.new_user(async_session, user)
-        await async_session.commit()
-        await async_session.refresh(user)
-    return get_jwt_tokens(user, response)
+    user, _ = await user_repo.upsert_tg_user(async_session,
+                                             tg_id=tg_id,
+                                             first_name=first_name,
+                                             last_name=last_name,
+                                             email=None,
+                                             password=None,
+                                             tg_username=username,
+                                             is_active=True,
+                                             photo_url=photo_url,
+                                             roles=[Role.Reader.value],
+                                             is_verified=True)
+    # Claims are read before the commit expires the loaded attributes
+    tokens = get_jwt_tokens(user, response)
+    await async_session.commit()
+    return tokens
 
 
 @auth_router.post('/logout')
@@ -161,34 +155,34 @@ async def logout(response: Response):
 
 @auth_router.post('/register')
 async def register(user_create: UserCreate, response: Response,
-                   async_session: AsyncSessionDep, sender: EmailSenderDep):
+                   async_session: AsyncSessionDep):
     """
-    Registers a user
-    :param sender:
+    Registers a user. The verification email is written to the outbox in the same transaction
+    and sent by src.email_worker
     :param response:
     :param user_create:
     :param async_session:
     :return:
     """
-    if await user_repo.check_is_user_exists(async_session, user_create):
+    hashed_pass = await get_password_hash(user_create.password)
+    user_guid = await user_repo.insert_user(async_session,
+                                            guid=uuid.uuid4(),
+                                            email=user_create.email,
+                                            first_name=user_create.first_name,
+                                            password=hashed_pass,
+                                            is_verified=False,
+                                            is_active=True,
+                                            roles=[Role.Reader.value])
+    if user_guid is None:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT)
-
-    hashed_pass = get_password_hash(user_create.password)
-    user = User(email=user_create.email,
-                first_name=user_create.first_name,
-                password=hashed_pass,
-                is_verified=False,
-                is_active=True,
-                roles=[Role.Reader.value])
-    await user_repo.new_user(async_session, user)
+    verification_link = f'{settings.FRONTEND_URL}/verify/{user_guid}'
+    message = registration_template.replace('{{verification_link}}', verification_link)
+    await outbox_repo.enqueue_email(async_session,
+                                    to=user_create.email,
+                                    subject="Account Created",
+                                    message_text=message)
     await async_session.commit()
-    await async_session.refresh(user)
     response.status_code = status.HTTP_201_CREATED
-    verification_link = f'{settings.FRONTEND_URL}/verify/{user.guid}'
-    message = registration_template.replace('{{verification_link}}', verification_link)
-    sender.send_with_retries(to=user_create.email,
-                             subject="Account Created",
-                             message_text=message)
 
 
 @auth_router.post('/verify')
@@ -198,6 +192,6 @@ async def verify_user(async_session: AsyncSessionDep, user: UserGUID):
 
 
 @auth_router.get('/check/email')
-async def check_username(email: str, async_session: AsyncSessionDep):
+async def check_username(email: str, async_session: AsyncReadSessionDep):
     user = await user_repo.get_user(async_session, email=email)
     return user is not None
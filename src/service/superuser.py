@@ -1,22 +1,42 @@
-from typing import List
+import io
+import logging
+import time
+from typing import List, Literal
 
 import sqlalchemy.exc
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile
+from fastapi.responses import StreamingResponse
 
+from conf import settings
 from src import json_schemes
-from src.dependencies import AsyncSessionDep
+from src.dependencies import AsyncSessionDep, AsyncReadSessionDep
 from src.json_schemes import UserRead
 from src.auth import get_current_superuser
 from src.repo import user as user_repo
+from src.repo import tweet as tweet_repo
+from src.repo import counter as counter_repo
+from src import importer
+from src import feed_cache
+from src.bulk_io import iter_records, get_format, encode_records
 
 # Used here just for swagger integrated login
 
 superuser_router = APIRouter(dependencies=[Depends(get_current_superuser)])
 
 
-@superuser_router.get('/users')
-async def get_users(async_session: AsyncSessionDep, search: str | None = None, page: int = 1, limit: int = 20) -> List[UserRead]:
-    return await user_repo.get_users(async_session, search=search, page=page, limit=limit)
+@superuser_router.get('/users', response_model=List[UserRead] | json_schemes.UserPage)
+async def get_users(async_session: AsyncReadSessionDep, search: str | None = None, page: int = 1, limit: int = 20,
+                    total: Literal['exact', 'estimate'] | None = None):
+    """
+    With `total` returns json_schemes.UserPage, counting users `exact`ly from row_counters
+    or with the planner's `estimate`. Search results are always counted with an estimate.
+    """
+    users = await user_repo.get_users(async_session, search=search, page=page, limit=limit)
+    if total is None:
+        return users
+    counter = counter_repo.USERS if not search else None
+    users_total = await counter_repo.get_total(async_session, counter, user_repo.get_count_query(search), kind=total)
+    return json_schemes.UserPage(items=users, total=users_total)
 
 
 @superuser_router.post('/users/delete')
@@ -26,6 +46,7 @@ async def delete_user(async_session: AsyncSessionDep, guid: str):
         await async_session.commit()
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    await feed_cache.invalidate()
 
 
 @superuser_router.post('/users/update')
@@ -33,3 +54,107 @@ async def update_user(async_session: AsyncSessionDep, guid: str, new_user_params
     await user_repo.update_user(async_session, update_user_id=guid, new_user_params=new_user_params)
     await async_session.commit()
 
+
+async def iter_guid_batches(async_session, users_filter: json_schemes.BulkUsersFilter):
+    if users_filter.guids:
+        for i in range(0, len(users_filter.guids), settings.BULK_BATCH_SIZE):
+            yield users_filter.guids[i:i + settings.BULK_BATCH_SIZE]
+    elif users_filter.search:
+        after_guid = None
+        while guids := await user_repo.get_user_guids(async_session, search=users_filter.search,
+                                                      after_guid=after_guid, limit=settings.BULK_BATCH_SIZE):
+            yield guids
+            after_guid = guids[-1]
+    else:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Specify guids or search')
+
+
+async def run_in_batches(async_session, users_filter: json_schemes.BulkUsersFilter, statement) -> json_schemes.BulkResult:
+    """
+    Runs `statement(async_session, guids)` once per batch of selected users, committing every batch
+    """
+    result = json_schemes.BulkResult(rows=0, batches=[])
+    async for guids in iter_guid_batches(async_session, users_filter):
+        start = time.perf_counter()
+        try:
+            rows = await statement(async_session, guids)
+            await async_session.commit()
+        except sqlalchemy.exc.IntegrityError as e:
+            await async_session.rollback()
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail=f'Batch {len(result.batches)} failed after {result.rows} rows: {e.orig}')
+        batch = json_schemes.BatchResult(rows=rows, seconds=time.perf_counter() - start)
+        logging.info(f"Bulk {statement.__name__} batch {len(result.batches)}: {batch.rows} rows in {batch.seconds:.3f}s")
+        result.batches.append(batch)
+        result.rows += rows
+    return result
+
+
+@superuser_router.post('/users/bulk/delete')
+async def delete_users(async_session: AsyncSessionDep, users_filter: json_schemes.BulkUsersFilter
+                       ) -> json_schemes.BulkResult:
+    """
+    Deletes the users with their tweets, committing every batch
+    """
+    try:
+        return await run_in_batches(async_session, users_filter, user_repo.delete_users)
+    finally:
+        # Batches committed before a failure are deleted too
+        await feed_cache.invalidate()
+
+
+@superuser_router.post('/users/bulk/update')
+async def update_users(async_session: AsyncSessionDep, users_update: json_schemes.BulkUsersUpdate
+                       ) -> json_schemes.BulkResult:
+    async def update_roles(session, guids):
+        return await user_repo.update_users(session, guids, json_schemes.SuperuserUserUpdate(roles=users_update.roles))
+
+    return await run_in_batches(async_session, users_update, update_roles)
+
+
+@superuser_router.post('/import/{kind}')
+async def import_data(async_session: AsyncSessionDep, kind: Literal['users', 'tweets'], file: UploadFile,
+                      file_format: Literal['ndjson', 'csv'] | None = None) -> StreamingResponse:
+    """
+    Imports users or tweets from an NDJSON or CSV file, see src.importer.
+    Streams progress back as NDJSON, one line per batch.
+    Answers 503 while another users import hashes passwords
+    """
+    try:
+        fmt = file_format or get_format(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if importer.is_pool_busy(kind):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Another import is in progress. Try again later.",
+                            headers={"Retry-After": str(importer.RETRY_AFTER_SECONDS)})
+    lines = io.TextIOWrapper(file.file, encoding='utf-8', newline='')
+
+    async def progress():
+        async for batch_progress in importer.import_records(async_session, kind, iter_records(lines, fmt)):
+            yield batch_progress.json() + '\n'
+
+    return StreamingResponse(progress(), media_type='application/x-ndjson')
+
+
+@superuser_router.get('/export/{kind}')
+async def export_data(async_session: AsyncReadSessionDep, kind: Literal['users', 'tweets'],
+                      file_format: Literal['ndjson', 'csv'] = 'ndjson') -> StreamingResponse:
+    """
+    Streams all users or tweets as NDJSON or CSV.
+    Rows are read through a server side cursor, so memory use does not depend on the table size
+    """
+    if kind == 'users':
+        schema = json_schemes.UserExport
+        rows = user_repo.stream_users(async_session, batch_size=settings.EXPORT_BATCH_SIZE)
+    else:
+        schema = json_schemes.TweetExport
+        rows = tweet_repo.stream_tweets(async_session, batch_size=settings.EXPORT_BATCH_SIZE)
+
+    async def records():
+        async for row in rows:
+            yield schema.from_orm(row)
+
+    media_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+    return StreamingResponse(encode_records(records(), schema, file_format), media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename="{kind}.{file_format}"'})
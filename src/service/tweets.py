@@ -1,18 +1,166 @@
-from fastapi import APIRouter
-from typing import List
+import asyncio
+import json
+import uuid
+from typing import List, Literal
 
-from src.dependencies import AsyncSessionDep
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+from src.dependencies import AsyncSessionDep, AsyncReadSessionDep, is_primary_sticky
+from src import db_models
 from src import json_schemes
+from src import feed_cache
 import src.repo.tweet as tweet_repo
+from src.repo import counter as counter_repo
 from src.auth import CurrentUserDep
+from src.utils import encode_cursor, decode_cursor
+from src.conditional import is_not_modified, get_not_modified_response
+from src.tweet_stream import get_tweet_listener
+from conf import settings
+from utils.pg_listener import PgListener
 
 tweet_router = APIRouter()
 
+AUTHOR_FIELDS = tuple(json_schemes.UserRead.__fields__)
+
+
+def with_photo_size(tweets, photo_size: str | None) -> List[json_schemes.Tweet]:
+    """
+    Replaces authors' photo_url with the requested variant from photo_urls, where it exists
+    """
+    tweets = [json_schemes.Tweet.from_orm(tweet) for tweet in tweets]
+    if photo_size is not None:
+        for tweet in tweets:
+            photo_urls = tweet.created_by.photo_urls or {}
+            tweet.created_by.photo_url = photo_urls.get(photo_size, tweet.created_by.photo_url)
+    return tweets
+
+
+def get_compact_feed(tweets: List[db_models.Tweet], photo_size: str | None, next_cursor: str | None,
+                     total: json_schemes.Total | None = None) -> dict:
+    """
+    Builds json_schemes.CompactFeed as plain dicts straight from the ORM objects,
+    every author is included once no matter how many of the tweets they wrote
+    """
+    authors = {}
+    items = []
+    for tweet in tweets:
+        author_guid = str(tweet.created_by_guid)
+        if author_guid not in authors and tweet.created_by is not None:
+            author = {field: getattr(tweet.created_by, field) for field in AUTHOR_FIELDS}
+            if photo_size is not None:
+                author['photo_url'] = (author['photo_urls'] or {}).get(photo_size, author['photo_url'])
+            authors[author_guid] = author
+        items.append({'guid': tweet.guid,
+                      'message': tweet.message,
+                      'created_by_guid': tweet.created_by_guid,
+                      'created_at': tweet.created_at})
+    return {'tweets': items, 'authors': authors, 'next_cursor': next_cursor,
+            'total': total.dict() if total is not None else None}
+
+
+@tweet_router.get('', response_model=List[json_schemes.Tweet] | json_schemes.TweetPage | json_schemes.CompactFeed)
+async def get_tweets(request: Request, async_session: AsyncReadSessionDep,
+                     page: int = 1, limit: int = 20,
+                     cursor: str | None = None,
+                     photo_size: str | None = None,
+                     feed_format: Literal['full', 'compact'] = Query('full', alias='format'),
+                     total: Literal['exact', 'estimate'] | None = None) -> Response:
+    """
+    Returns the feed, newest first.
+    Without `cursor` the feed is paged with `page`/`limit`.
+    With `cursor` (empty for the first page, then `next_cursor` of the previous response)
+    keyset pagination is used, which costs the same at any depth.
+    `photo_size` (e.g. 64) makes authors' photo_url point to that variant of their photo.
+    `format=compact` returns json_schemes.CompactFeed, where tweets reference authors by guid.
+    `total` adds the number of tweets in the feed, `exact` from row_counters or `estimate` from the planner.
+    With `total` a page of the `page`/`limit` paging is returned as json_schemes.TweetPage.
+    Serialized pages are cached for FEED_CACHE_TTL_SECONDS or until a new tweet is posted.
+    Clients that have written recently read from the primary and skip cached pages,
+    which may have been filled from a lagging replica after their write.
+    The ETag is a digest of the body, while the page is cached If-None-Match is answered
+    with 304 Not Modified without querying the database.
+    """
+    key = feed_cache.get_page_key(page=page, limit=limit, cursor=cursor, photo_size=photo_size, format=feed_format,
+                                  total=total)
+    cached = None if is_primary_sticky(request) else await feed_cache.get_page(key)
+    if cached is not None:
+        etag, body = cached
+    else:
+        tweets, next_cursor = await load_feed(async_session, page=page, limit=limit, cursor=cursor)
+        feed_total = None
+        if total is not None:
+            feed_total = await counter_repo.get_total(async_session, counter_repo.TWEETS,
+                                                      tweet_repo.get_count_query(), kind=total)
+        if feed_format == 'compact':
+            # Guids loaded through asyncpg are its own UUID type, which orjson does not know
+            body = orjson.dumps(get_compact_feed(tweets, photo_size, next_cursor, feed_total), default=str)
+        elif cursor is None and total is None:
+            body = json.dumps(jsonable_encoder(with_photo_size(tweets, photo_size))).encode()
+        else:
+            feed = json_schemes.TweetPage(items=with_photo_size(tweets, photo_size), next_cursor=next_cursor,
+                                          total=feed_total)
+            body = json.dumps(jsonable_encoder(feed)).encode()
+        etag = await feed_cache.set_page(key, body)
+    if is_not_modified(request, etag, endpoint='feed'):
+        return get_not_modified_response(etag)
+    return Response(content=body, media_type='application/json', headers={'ETag': etag})
+
+
+async def load_feed(async_session, page: int, limit: int, cursor: str | None,
+                    created_by_guid: uuid.UUID | None = None) -> tuple[List[db_models.Tweet], str | None]:
+    """
+    :return: tweets of the page and the cursor of the next page if `cursor` is used and there is one
+    """
+    if cursor is None:
+        tweets = await tweet_repo.get_tweets(async_session, page=page, limit=limit, created_by_guid=created_by_guid)
+        return tweets, None
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    tweets = await tweet_repo.get_tweets(async_session, page=None, limit=limit + 1, after=after,
+                                         created_by_guid=created_by_guid)
+    next_cursor = None
+    if len(tweets) > limit:
+        tweets = tweets[:limit]
+        next_cursor = encode_cursor(tweets[-1].created_at, tweets[-1].guid)
+    return tweets, next_cursor
+
+
+@tweet_router.get('/by/{user_guid}', response_model=json_schemes.TweetPage)
+async def get_user_tweets(user_guid: uuid.UUID, async_session: AsyncReadSessionDep,
+                          limit: int = 20, cursor: str = '', photo_size: str | None = None):
+    """
+    Returns tweets of one user, newest first.
+    `cursor` is empty for the first page, then `next_cursor` of the previous response.
+    """
+    tweets, next_cursor = await load_feed(async_session, page=1, limit=limit, cursor=cursor,
+                                          created_by_guid=user_guid)
+    return json_schemes.TweetPage(items=with_photo_size(tweets, photo_size), next_cursor=next_cursor)
+
+
+@tweet_router.get('/stream')
+async def stream_new_tweets(request: Request, listener: PgListener = Depends(get_tweet_listener)):
+    """
+    Server-sent events with every tweet posted after connecting (`event: tweet`, data is json_schemes.Tweet).
+    A comment is sent every STREAM_HEARTBEAT_SECONDS to keep proxies from closing an idle connection.
+    Clients that can't keep up lose the oldest tweets beyond STREAM_BUFFER_SIZE.
+    """
+    async def get_events():
+        async with listener.subscribe() as queue:
+            while not await request.is_disconnected():
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=settings.STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': heartbeat\n\n'
+                    continue
+                yield f'event: tweet\ndata: {message}\n\n'
 
-@tweet_router.get('')
-async def get_tweets(async_session: AsyncSessionDep,
-                     page: int = 1, limit: int = 20) -> List[json_schemes.Tweet]:
-    return await tweet_repo.get_tweets(async_session, page=page, limit=limit)
+    return StreamingResponse(get_events(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @tweet_router.post('/new')
@@ -3,24 +3,36 @@ import uuid
 
 import fastapi
 import sqlalchemy.exc
-from fastapi import APIRouter, HTTPException, status, UploadFile
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, Response, status, UploadFile
 from jose import jwt, ExpiredSignatureError, JWTError
 
 from src import json_schemes
 from conf import settings
 from conf.secrets import PASSWORD_ENCODING_SECRET
-from src.dependencies import AsyncSessionDep, EmailSenderDep, S3PublicDep
+from src.dependencies import AsyncSessionDep, AsyncSessionMakerDep, S3PublicDep
 from src.json_schemes import UserRead
-from src.auth import CurrentUserDep
+from src.auth import CurrentUserDep, CurrentUserORMDep
 from src.repo import user as user_repo
+from src.repo import outbox as outbox_repo
 from src.service import auth
+from src.photos import make_photo_variants
+from src.conditional import is_not_modified, get_not_modified_response
 from src.service.auth import create_jwt_token, get_password_hash
+from utils.s3 import FileTooLarge
 
 user_router = APIRouter()
 
 
 @user_router.get('/info', response_model=UserRead)
-async def get_user_info(user: CurrentUserDep):
+async def get_user_info(request: Request, response: Response, user: CurrentUserDep):
+    """
+    The ETag is made of the user guid and users.version, so a client polling its profile
+    gets 304 Not Modified until the user row is updated
+    """
+    etag = f'"{user.guid}.{user.version}"'
+    if is_not_modified(request, etag, endpoint='user_info'):
+        return get_not_modified_response(etag)
+    response.headers['ETag'] = etag
     return user
 
 
@@ -39,14 +51,13 @@ async def update_user(async_session: AsyncSessionDep,
 
 @user_router.post('/forgot_password')
 async def forgot_password(async_session: AsyncSessionDep,
-                          email_sender: EmailSenderDep,
                           email_data: json_schemes.Email):
     user = await user_repo.get_user(async_session, email=email_data.email)
     if user is None:
         raise fastapi.HTTPException(status_code=fastapi.status.HTTP_404_NOT_FOUND)
     token = create_jwt_token(data={'user_guid': str(user.guid)}, expires_delta=datetime.timedelta(days=1))
-    email_sender.send_with_retries(to=email_data.email, subject='Password Recovery',
-                                   message_text=f"""
+    await outbox_repo.enqueue_email(async_session, to=email_data.email, subject='Password Recovery',
+                                    message_text=f"""
                                                                 <html>
                                                                 <body>
                                                                 <h2>Hello, Dear Friend!</h2>
@@ -56,6 +67,7 @@ async def forgot_password(async_session: AsyncSessionDep,
                                                                 </body>
                                                                 </html>
                                                                 """)
+    await async_session.commit()
 
 
 @user_router.post('/forgot_password/verify')
@@ -77,23 +89,31 @@ async def forgot_password(async_session: AsyncSessionDep, data: json_schemes.Rec
 
     user_guid = payload.get('user_guid')
     user = await user_repo.get_user(async_session, user_guid=user_guid)
-    user.password = get_password_hash(data.new_password)
+    user.password = await get_password_hash(data.new_password)
     await async_session.commit()
 
 
 @user_router.post('/change_password')
-async def change_password(async_session: AsyncSessionDep, user: CurrentUserDep, data: json_schemes.ChangePassword):
-    if not auth.verify_password(data.old_password, user.password):
+async def change_password(async_session: AsyncSessionDep, user: CurrentUserORMDep, data: json_schemes.ChangePassword):
+    if not await auth.verify_password(data.old_password, user.password):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST)
-    user.password = data.new_password
+    user.password = await get_password_hash(data.new_password)
     await async_session.commit()
 
 
 @user_router.post('/upload_photo')
-async def upload_photo(async_session: AsyncSessionDep, s3: S3PublicDep, user: CurrentUserDep, file: UploadFile):
+async def upload_photo(async_session: AsyncSessionDep, session_maker: AsyncSessionMakerDep, s3: S3PublicDep,
+                       user: CurrentUserORMDep, file: UploadFile, background_tasks: BackgroundTasks):
+    if file.size is not None and file.size > settings.MAX_PHOTO_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    user_guid = user.guid
     filename = uuid.uuid4()
-    filepath = f'/public/photos/{user.guid}/{filename}'
-    s3.upload_file(filepath, file)
+    filepath = f'/public/photos/{user_guid}/{filename}'
+    try:
+        await s3.upload_stream(filepath, file, max_size=settings.MAX_PHOTO_SIZE)
+    except FileTooLarge:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
     user.photo_url = s3.get_file_url(filepath)
+    user.photo_urls = None
     await async_session.commit()
-
+    background_tasks.add_task(make_photo_variants, s3, user_guid, filepath, session_maker)
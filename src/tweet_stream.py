@@ -0,0 +1,36 @@
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from conf import settings
+from conf.secrets import db_listen_address, db_user, db_password, db_name
+from src import json_schemes
+from src.repo import tweet as tweet_repo
+from src.repo.tweet import TWEETS_CHANNEL
+from utils.db_connection import AsyncMainSession, get_dsn
+from utils.pg_listener import PgListener
+
+
+def get_event_loader(session_maker: async_sessionmaker):
+    async def load_event(payload: str) -> Optional[str]:
+        """
+        Turns a notification (the tweet guid) into the serialized tweet.
+        Runs once per new tweet per process, however many clients are subscribed.
+        """
+        async with session_maker() as async_session:
+            tweet = await tweet_repo.get_tweet(async_session, payload)
+            if tweet is None:
+                return None
+            return json_schemes.Tweet.from_orm(tweet).json()
+
+    return load_event
+
+
+tweet_listener = PgListener(get_dsn(db_listen_address, db_user, db_password, db_name),
+                            channel=TWEETS_CHANNEL,
+                            transform=get_event_loader(AsyncMainSession),
+                            buffer_size=settings.STREAM_BUFFER_SIZE)
+
+
+def get_tweet_listener() -> PgListener:
+    return tweet_listener
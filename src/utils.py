@@ -1,4 +1,7 @@
+import base64
+import datetime
 import re
+import uuid
 
 
 def make_search_query(search: str):
@@ -6,3 +9,21 @@ def make_search_query(search: str):
     search = pattern.sub(' ', search)
     search = ':* | '.join(search.strip().lower().split(' ')) + ':*'
     return search
+
+
+def encode_cursor(created_at: datetime.datetime, guid: uuid.UUID) -> str:
+    raw = f'{created_at.isoformat()}|{guid}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, uuid.UUID]:
+    """
+    Reverse of encode_cursor
+    :raises ValueError: if the cursor was not produced by encode_cursor
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, guid = raw.split('|')
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(guid)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
@@ -1,15 +1,21 @@
 import pytest
 import os
 
+from fastapi import Request
 from httpx import AsyncClient
 from sqlalchemy_utils import drop_database, database_exists, create_database
 
 from src import dependencies
+from src import feed_cache
+from src import tweet_stream
+from src import rate_limits
 import src.db_models as db
 from sqlalchemy import create_engine, update
 
+from benchmarks import seed_data
 from main import app
-from utils.db_connection import get_connection_string
+from utils.db_connection import get_connection_string, get_dsn
+from utils.pg_listener import PgListener
 from utils.db_connection_sync import get_sync_connection_string
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
@@ -32,7 +38,8 @@ async def async_client():
     async_engine = create_async_engine(get_connection_string(db_address, db_user, db_password, db_name))
     AsyncMainSession = async_sessionmaker(async_engine)
 
-    async def _get_async_session():
+    async def _get_async_session(request: Request):
+        dependencies.mark_primary_sticky(request)
         async_session = AsyncMainSession()
         try:
             yield async_session
@@ -40,6 +47,20 @@ async def async_client():
             await async_session.close()
 
     app.dependency_overrides[dependencies.get_async_session] = _get_async_session
+    async def _get_async_read_session():
+        async_session = AsyncMainSession()
+        try:
+            yield async_session
+        finally:
+            await async_session.close()
+
+    # The test database stands in for both the primary and the replica
+    app.dependency_overrides[dependencies.get_async_read_session] = _get_async_read_session
+    app.dependency_overrides[dependencies.get_async_session_maker] = lambda: AsyncMainSession
+    # Pages cached by previous test classes belong to a dropped database
+    await feed_cache.invalidate()
+    # Every test class registers and logs in from the same address
+    await rate_limits.rate_limit_backend.clear()
     client = await AsyncClient(app=app, base_url='http://testenv').__aenter__()
     try:
         yield client
@@ -110,6 +131,46 @@ async def superuser_access(async_client, async_session):
     return {'Authorization': 'Bearer ' + access['access_token']}
 
 
+@pytest.fixture(scope='class')
+async def tweet_listener():
+    db_address = 'localhost'
+    db_user = os.getenv('TEST_DB_USER', 'testuser')
+    db_password = os.getenv('TEST_DB_PASSWORD', '123')
+    db_name = os.getenv('TEST_DB_NAME', 'test')
+    async_engine = create_async_engine(get_connection_string(db_address, db_user, db_password, db_name))
+    listener = PgListener(get_dsn(db_address, db_user, db_password, db_name),
+                          channel=tweet_stream.TWEETS_CHANNEL,
+                          transform=tweet_stream.get_event_loader(async_sessionmaker(async_engine)),
+                          buffer_size=10)
+    app.dependency_overrides[tweet_stream.get_tweet_listener] = lambda: listener
+    try:
+        yield listener
+    finally:
+        await listener.close()
+
+
+@pytest.fixture(scope='class')
+async def scale_data():
+    """
+    Seeds the test database with TEST_SCALE_USERS users and TEST_SCALE_TWEETS tweets (10 per user by default)
+    """
+    users = int(os.getenv('TEST_SCALE_USERS', '0'))
+    if not users:
+        pytest.skip('Set TEST_SCALE_USERS to run scale tests')
+    db_address = 'localhost'
+    db_user = os.getenv('TEST_DB_USER', 'testuser')
+    db_password = os.getenv('TEST_DB_PASSWORD', '123')
+    db_name = os.getenv('TEST_DB_NAME', 'test')
+    async_engine = create_async_engine(get_connection_string(db_address, db_user, db_password, db_name))
+    config = seed_data.SeedConfig(users=users,
+                                  tweets=int(os.getenv('TEST_SCALE_TWEETS', str(users * 10))),
+                                  seed=int(os.getenv('TEST_SCALE_SEED', '0')))
+    try:
+        yield await seed_data.seed(async_sessionmaker(async_engine), config)
+    finally:
+        await async_engine.dispose()
+
+
 @pytest.fixture(scope='class')
 def mocked_connection() -> str:
     db_address = 'localhost'
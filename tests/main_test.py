@@ -1,8 +1,30 @@
+import asyncio
+import csv
+import datetime
+import io
+import json
+import time
+import uuid
+
 import pytest
 import sqlalchemy as sql
-from fastapi import status
+from PIL import Image
+from fastapi import Request, status
+from prometheus_client import REGISTRY
 
 import src.db_models as db
+from conf import settings
+from main import app
+from src import dependencies
+from src import email_worker
+from src import feed_cache
+from src import partitions
+from src import photos
+from src.repo import tweet as tweet_repo
+from src.repo import user as user_repo
+from utils import comms
+from utils import images
+from utils import s3
 
 
 class TestRegisterAuthFlow:
@@ -27,6 +49,17 @@ class TestRegisterAuthFlow:
                                                                             'password': test_password})
         assert login_response.status_code == 200
 
+    @pytest.mark.anyio
+    async def test_register_duplicate_and_verify_unknown(self, async_client):
+        register_response = await async_client.post('/auth/register', json={'password': 'other_password',
+                                                                            'email': 'testemail@email.com',
+                                                                            'first_name': 'Jane',
+                                                                            })
+        assert register_response.status_code == 409
+
+        verify_response = await async_client.post('/auth/verify', json={'user_guid': str(uuid.uuid4())})
+        assert verify_response.status_code == 404
+
 
 class TestSuperuserRights:
     @pytest.mark.anyio
@@ -39,3 +72,423 @@ class TestSuperuserRights:
         users_resp = await async_client.get('/superuser/users', headers=superuser_access)
         assert users_resp.status_code == status.HTTP_200_OK
         assert len(users_resp.json()) > 0
+
+    @pytest.mark.anyio
+    async def test_superuser_search(self, async_client, superuser_access):
+        users_resp = await async_client.get('/superuser/users', params={'search': 'superus'}, headers=superuser_access)
+        assert users_resp.status_code == status.HTTP_200_OK
+        assert [user['email'] for user in users_resp.json()] == ['superuser@email.com']
+
+        users_resp = await async_client.get('/superuser/users', params={'search': 'nobody'}, headers=superuser_access)
+        assert users_resp.json() == []
+
+    @pytest.mark.anyio
+    async def test_users_total(self, async_client, superuser_access):
+        users_resp = await async_client.get('/superuser/users', params={'limit': 100}, headers=superuser_access)
+        total_resp = await async_client.get('/superuser/users', params={'limit': 1, 'total': 'exact'},
+                                            headers=superuser_access)
+        assert total_resp.json()['total'] == {'value': len(users_resp.json()), 'kind': 'exact'}
+        assert len(total_resp.json()['items']) == 1
+
+        for kind in ('exact', 'estimate'):
+            search_resp = await async_client.get('/superuser/users', params={'search': "superus'); --", 'total': kind},
+                                                 headers=superuser_access)
+            assert search_resp.status_code == status.HTTP_200_OK
+            assert search_resp.json()['total']['kind'] == 'estimate'
+            assert search_resp.json()['total']['value'] >= 0
+
+
+class TestRateLimit:
+    @pytest.mark.anyio
+    async def test_login_limited_by_email(self, async_client):
+        for _ in range(settings.LOGIN_EMAIL_BURST):
+            login_response = await async_client.post('/auth/login/email', data={'username': 'victim@email.com',
+                                                                                'password': 'guess'})
+            assert login_response.status_code == status.HTTP_400_BAD_REQUEST
+        login_response = await async_client.post('/auth/login/email', data={'username': 'Victim@email.com',
+                                                                            'password': 'guess'})
+        assert login_response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(login_response.headers['retry-after']) > 0
+
+        login_response = await async_client.post('/auth/login/email', data={'username': 'other@email.com',
+                                                                            'password': 'guess'})
+        assert login_response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestReadYourWrites:
+    @pytest.mark.anyio
+    async def test_writes_set_sticky_cookie(self, async_client, superuser_access):
+        async_client.cookies.clear()
+        feed_resp = await async_client.get('/tweets')
+        assert dependencies.PRIMARY_STICKY_COOKIE not in feed_resp.cookies
+
+        new_resp = await async_client.post('/tweets/new', json={'message': 'write'}, headers=superuser_access)
+        assert new_resp.cookies.get(dependencies.PRIMARY_STICKY_COOKIE) == '1'
+        # The import returns its own StreamingResponse
+        import_resp = await async_client.post('/superuser/import/tweets', headers=superuser_access,
+                                              files={'file': ('tweets.ndjson', b'', 'application/x-ndjson')})
+        assert import_resp.status_code == status.HTTP_200_OK
+        assert import_resp.cookies.get(dependencies.PRIMARY_STICKY_COOKIE) == '1'
+
+    @pytest.mark.anyio
+    async def test_read_session_follows_cookie(self, monkeypatch):
+        class FakeSession:
+            def __init__(self, name: str):
+                self.name = name
+
+            async def close(self):
+                pass
+
+        monkeypatch.setattr(dependencies, 'AsyncMainSession', lambda: FakeSession('primary'))
+        monkeypatch.setattr(dependencies, 'AsyncReplicaSession', lambda: FakeSession('replica'))
+        for headers, expected in (([], 'replica'),
+                                  ([(b'cookie', f'{dependencies.PRIMARY_STICKY_COOKIE}=1'.encode())], 'primary')):
+            sessions = dependencies.get_async_read_session(Request({'type': 'http', 'method': 'GET',
+                                                                    'headers': headers}))
+            assert (await sessions.__anext__()).name == expected
+            await sessions.aclose()
+
+
+class TestSuperuserBulk:
+    @pytest.mark.anyio
+    async def test_bulk_update_and_delete(self, async_client, async_session, superuser_access):
+        for i in range(3):
+            register_response = await async_client.post('/auth/register', json={'password': 'test_password',
+                                                                                'email': f'spam{i}@spam.com',
+                                                                                'first_name': 'Spammer',
+                                                                                })
+            assert register_response.status_code == 201
+
+        update_resp = await async_client.post('/superuser/users/bulk/update', headers=superuser_access,
+                                              json={'search': 'spammer', 'roles': []})
+        assert update_resp.status_code == status.HTTP_200_OK
+        assert update_resp.json()['rows'] == 3
+
+        users_query = await async_session.execute(sql.select(db.User.guid).filter(db.User.email.like('spam%')))
+        guids = users_query.scalars().all()
+        async_session.add(db.Tweet(guid=uuid.uuid4(), message='spam', created_by_guid=guids[0]))
+        await async_session.commit()
+        delete_resp = await async_client.post('/superuser/users/bulk/delete', headers=superuser_access,
+                                              json={'guids': [str(guid) for guid in guids]})
+        assert delete_resp.status_code == status.HTTP_200_OK
+        assert delete_resp.json()['rows'] == 3
+
+        users_resp = await async_client.get('/superuser/users', params={'search': 'spammer'}, headers=superuser_access)
+        assert users_resp.json() == []
+        tweets_query = await async_session.execute(sql.select(db.Tweet).filter(db.Tweet.created_by_guid.in_(guids)))
+        assert tweets_query.scalars().all() == []
+
+    @pytest.mark.anyio
+    async def test_bulk_requires_filter(self, async_client, superuser_access):
+        delete_resp = await async_client.post('/superuser/users/bulk/delete', headers=superuser_access, json={})
+        assert delete_resp.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestImport:
+    @pytest.mark.anyio
+    async def test_import_users(self, async_client, async_session, superuser_access):
+        users = '\n'.join([
+            json.dumps({'email': 'imported1@email.com', 'first_name': 'Ann', 'password': 'pass1'}),
+            json.dumps({'email': 'imported2@email.com', 'password': 'pass2'}),
+            json.dumps({'email': 'imported3@email.com', 'first_name': 'Bob', 'password': 'pass3',
+                        'roles': ['reader'], 'is_verified': True}),
+        ])
+        import_resp = await async_client.post('/superuser/import/users', headers=superuser_access,
+                                              files={'file': ('users.ndjson', users.encode(), 'application/x-ndjson')})
+        assert import_resp.status_code == status.HTTP_200_OK
+        progress = [json.loads(line) for line in import_resp.text.splitlines()]
+        assert sum(batch['imported'] for batch in progress) == 2
+        assert sum(batch['rejected'] for batch in progress) == 1
+        assert progress[0]['errors'][0]['line'] == 2
+
+        users_query = await async_session.execute(sql.select(db.User).filter(db.User.email.like('imported%')))
+        imported = users_query.scalars().all()
+        assert sorted(user.email for user in imported) == ['imported1@email.com', 'imported3@email.com']
+        assert all(user.password.startswith('$2') for user in imported)
+
+    @pytest.mark.anyio
+    async def test_export_users(self, async_client, superuser_access):
+        export_resp = await async_client.get('/superuser/export/users', headers=superuser_access)
+        assert export_resp.status_code == status.HTTP_200_OK
+        emails = [json.loads(line)['email'] for line in export_resp.text.splitlines()]
+        assert 'superuser@email.com' in emails
+
+        export_resp = await async_client.get('/superuser/export/users', params={'file_format': 'csv'},
+                                             headers=superuser_access)
+        rows = list(csv.DictReader(export_resp.text.splitlines()))
+        assert sorted(row['email'] for row in rows) == sorted(emails)
+
+
+class TestTweetFeed:
+    @pytest.mark.anyio
+    async def test_cursor_pagination(self, async_client, user_access):
+        for i in range(5):
+            new_resp = await async_client.post('/tweets/new', json={'message': f'tweet {i}'}, headers=user_access)
+            assert new_resp.status_code == status.HTTP_200_OK
+
+        messages = []
+        cursor = ''
+        while cursor is not None:
+            feed_resp = await async_client.get('/tweets', params={'cursor': cursor, 'limit': 2})
+            assert feed_resp.status_code == status.HTTP_200_OK
+            feed = feed_resp.json()
+            messages += [tweet['message'] for tweet in feed['items']]
+            cursor = feed['next_cursor']
+        assert messages == [f'tweet {i}' for i in reversed(range(5))]
+
+        page_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 2})
+        assert [tweet['message'] for tweet in page_resp.json()] == messages[:2]
+
+    @pytest.mark.anyio
+    async def test_compact_feed(self, async_client):
+        full_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 5})
+        compact_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 5, 'format': 'compact'})
+        assert compact_resp.status_code == status.HTTP_200_OK
+        compact = compact_resp.json()
+        assert [tweet['guid'] for tweet in compact['tweets']] == [tweet['guid'] for tweet in full_resp.json()]
+        assert len(compact['authors']) == 1
+        for tweet in full_resp.json():
+            assert compact['authors'][tweet['created_by']['guid']] == tweet['created_by']
+
+    @pytest.mark.anyio
+    async def test_bad_cursor(self, async_client):
+        feed_resp = await async_client.get('/tweets', params={'cursor': 'garbage'})
+        assert feed_resp.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.anyio
+    async def test_new_tweet_invalidates_feed_cache(self, async_client, user_access):
+        first_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 1})
+        await async_client.post('/tweets/new', json={'message': 'fresh tweet'}, headers=user_access)
+        second_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 1})
+        assert second_resp.json() != first_resp.json()
+        assert second_resp.json()[0]['message'] == 'fresh tweet'
+
+    @pytest.mark.anyio
+    async def test_sticky_reads_skip_feed_cache(self, async_client, user_access):
+        await async_client.post('/tweets/new', json={'message': 'sticky tweet'}, headers=user_access)
+        # A page filled by another client from a replica that has not got the tweet yet
+        key = feed_cache.get_page_key(page=1, limit=1, cursor=None, photo_size=None, format='full', total=None)
+        await feed_cache.set_page(key, b'[]')
+
+        async_client.cookies.clear()
+        replica_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 1})
+        assert replica_resp.json() == []
+        sticky_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 1},
+                                             cookies={dependencies.PRIMARY_STICKY_COOKIE: '1'})
+        assert sticky_resp.json()[0]['message'] == 'sticky tweet'
+
+    @pytest.mark.anyio
+    async def test_feed_etag(self, async_client, user_access):
+        feed_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 2})
+        etag = feed_resp.headers['etag']
+        cached_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 2},
+                                             headers={'If-None-Match': etag})
+        assert cached_resp.status_code == status.HTTP_304_NOT_MODIFIED
+        assert cached_resp.content == b''
+
+        await async_client.post('/tweets/new', json={'message': 'etag tweet'}, headers=user_access)
+        changed_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 2},
+                                              headers={'If-None-Match': etag})
+        assert changed_resp.status_code == status.HTTP_200_OK
+        assert changed_resp.headers['etag'] != etag
+
+    @pytest.mark.anyio
+    async def test_user_tweets(self, async_client, user_access):
+        user_guid = (await async_client.get('/user/info', headers=user_access)).json()['guid']
+        feed_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 100})
+        expected = [tweet['guid'] for tweet in feed_resp.json()]
+
+        guids = []
+        cursor = ''
+        while cursor is not None:
+            timeline_resp = await async_client.get(f'/tweets/by/{user_guid}', params={'cursor': cursor, 'limit': 2})
+            assert timeline_resp.status_code == status.HTTP_200_OK
+            timeline = timeline_resp.json()
+            assert all(tweet['created_by']['guid'] == user_guid for tweet in timeline['items'])
+            guids += [tweet['guid'] for tweet in timeline['items']]
+            cursor = timeline['next_cursor']
+        assert guids == expected
+
+        other_resp = await async_client.get(f'/tweets/by/{uuid.uuid4()}')
+        assert other_resp.json()['items'] == []
+        assert other_resp.json()['next_cursor'] is None
+
+    @pytest.mark.anyio
+    async def test_feed_total(self, async_client):
+        feed_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 100})
+        exact_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 2, 'total': 'exact'})
+        assert exact_resp.json()['total'] == {'value': len(feed_resp.json()), 'kind': 'exact'}
+        assert len(exact_resp.json()['items']) == 2
+
+        estimate_resp = await async_client.get('/tweets', params={'cursor': '', 'total': 'estimate'})
+        assert estimate_resp.json()['total']['kind'] == 'estimate'
+
+
+class TestTweetPartitions:
+    @pytest.mark.anyio
+    async def test_partitions(self, async_client, async_session, user_access):
+        await partitions.ensure_partitions(async_session)
+        current = datetime.datetime.now(datetime.timezone.utc).date().replace(day=1)
+        months = await partitions.get_attached_months(async_session)
+        assert months == [partitions.add_months(current, i) for i in range(settings.TWEET_PARTITIONS_AHEAD + 1)]
+
+        await async_client.post('/tweets/new', json={'message': 'partitioned tweet'}, headers=user_access)
+        feed_resp = await async_client.get('/tweets', params={'limit': 10, 'total': 'exact'})
+        assert feed_resp.json()['total']['value'] == 1
+
+        dropped = await partitions.drop_partitions_before(async_session, partitions.add_months(current, 1))
+        assert dropped == [partitions.get_partition_name(current)]
+        feed_resp = await async_client.get('/tweets', params={'limit': 20, 'total': 'exact'})
+        assert feed_resp.json()['items'] == []
+        assert feed_resp.json()['total']['value'] == 0
+
+    @pytest.mark.anyio
+    async def test_default_partition_rows(self, async_session, user_access):
+        current = datetime.datetime.now(datetime.timezone.utc).date().replace(day=1)
+        month = partitions.add_months(current, settings.TWEET_PARTITIONS_AHEAD + 1)
+        user_query = await async_session.execute(sql.select(db.User.guid).filter_by(email='testemail@email.com'))
+        async_session.add(db.Tweet(guid=uuid.uuid4(), message='scheduled', created_by_guid=user_query.scalar_one(),
+                                   created_at=datetime.datetime(month.year, month.month, 2,
+                                                                tzinfo=datetime.timezone.utc)))
+        await async_session.commit()
+        await partitions.ensure_partitions(async_session)
+        assert REGISTRY.get_sample_value('tweets_default_partition_rows') == 1
+
+        await partitions.create_partition(async_session, month)
+        await async_session.commit()
+        count_resp = await async_session.execute(sql.text(f'SELECT count(*) FROM {partitions.get_partition_name(month)}'))
+        assert count_resp.scalar_one() == 1
+        await partitions.ensure_partitions(async_session)
+        assert REGISTRY.get_sample_value('tweets_default_partition_rows') == 0
+
+
+class TestUserInfo:
+    @pytest.mark.anyio
+    async def test_info_etag(self, async_client, user_access):
+        info_resp = await async_client.get('/user/info', headers=user_access)
+        etag = info_resp.headers['etag']
+        cached_resp = await async_client.get('/user/info', headers={**user_access, 'If-None-Match': etag})
+        assert cached_resp.status_code == status.HTTP_304_NOT_MODIFIED
+
+        update_resp = await async_client.post('/user/update', headers=user_access,
+                                              json={'email': 'testemail@email.com', 'first_name': 'Jane'})
+        assert update_resp.status_code == status.HTTP_200_OK
+        changed_resp = await async_client.get('/user/info', headers={**user_access, 'If-None-Match': etag})
+        assert changed_resp.status_code == status.HTTP_200_OK
+        assert changed_resp.json()['first_name'] == 'Jane'
+
+
+class TestTweetStream:
+    @pytest.mark.anyio
+    async def test_new_tweets_are_published(self, async_client, user_access, tweet_listener):
+        async with tweet_listener.subscribe() as queue:
+            for i in range(3):
+                await async_client.post('/tweets/new', json={'message': f'live {i}'}, headers=user_access)
+            messages = [json.loads(await asyncio.wait_for(queue.get(), timeout=5)) for _ in range(3)]
+        assert [message['message'] for message in messages] == ['live 0', 'live 1', 'live 2']
+        assert messages[0]['created_by']['email'] == 'testemail@email.com'
+
+
+class TestEmailOutbox:
+    @pytest.mark.anyio
+    async def test_register_enqueues_email(self, async_client, async_session):
+        register_response = await async_client.post('/auth/register', json={'password': 'test_password',
+                                                                            'email': 'outbox@email.com',
+                                                                            'first_name': 'John',
+                                                                            })
+        assert register_response.status_code == 201
+
+        sent = []
+
+        class RecordingSender(comms.MockSender):
+            def send(self, to: str, subject: str, message_text: str):
+                sent.append(to)
+
+        processed = await email_worker.deliver_batch(async_session, RecordingSender())
+        assert processed == 1
+        assert sent == ['outbox@email.com']
+
+        email_query = await async_session.execute(sql.select(db.EmailOutbox))
+        email = email_query.scalars().one()
+        assert email.status == 'sent'
+        assert await email_worker.deliver_batch(async_session, RecordingSender()) == 0
+
+
+class TestPhotoUpload:
+    @staticmethod
+    def make_png(width: int, height: int) -> bytes:
+        buffer = io.BytesIO()
+        Image.new('RGB', (width, height), (200, 30, 30)).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_make_derivatives(self):
+        variants = images.make_derivatives(self.make_png(600, 400), settings.PHOTO_SIZES)
+        assert set(variants) == {'original', *(str(size) for size in settings.PHOTO_SIZES)}
+        for name, content in variants.items():
+            with Image.open(io.BytesIO(content)) as variant:
+                assert variant.format == 'WEBP'
+                assert max(variant.size) == (600 if name == 'original' else int(name))
+
+    @pytest.mark.anyio
+    async def test_upload_photo(self, async_client, user_access):
+        storage = s3.S3StorageBase()
+        app.dependency_overrides[dependencies.get_s3] = lambda: storage
+        try:
+            photo = self.make_png(600, 400)
+            upload_resp = await async_client.post('/user/upload_photo', headers=user_access,
+                                                  files={'file': ('photo.png', photo, 'image/png')})
+            assert upload_resp.status_code == status.HTTP_200_OK
+            # The background task has run by the time the test client returns the response
+            original_path, = [path for path, content in storage.objects.items() if content == photo]
+            size = settings.PHOTO_SIZES[0]
+            variant_path = photos.get_variant_path(original_path, str(size))
+            with Image.open(io.BytesIO(storage.objects[variant_path])) as variant:
+                assert max(variant.size) == size
+
+            await async_client.post('/tweets/new', json={'message': 'with photo'}, headers=user_access)
+            feed_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 1, 'photo_size': str(size)})
+            assert feed_resp.json()[0]['created_by']['photo_url'] == storage.get_file_url(variant_path)
+            feed_resp = await async_client.get('/tweets', params={'page': 1, 'limit': 1})
+            assert feed_resp.json()[0]['created_by']['photo_url'] == storage.get_file_url(original_path)
+
+            too_large = b'0' * (settings.MAX_PHOTO_SIZE + 1)
+            upload_resp = await async_client.post('/user/upload_photo', headers=user_access,
+                                                  files={'file': ('photo.png', too_large, 'image/png')})
+            assert upload_resp.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        finally:
+            app.dependency_overrides.pop(dependencies.get_s3)
+
+
+class TestScale:
+    @staticmethod
+    async def get_p95(call, repeat: int = 20) -> float:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            await call()
+            timings.append(time.perf_counter() - started)
+        return sorted(timings)[int(repeat * 0.95) - 1]
+
+    @pytest.mark.anyio
+    async def test_users_search(self, async_session, scale_data, record_property):
+        users = await user_repo.get_users(async_session, search='ann smith', page=1, limit=20)
+        assert len(users) == 20
+        p95 = await self.get_p95(lambda: user_repo.get_users(async_session, search='ann smith', page=1, limit=20))
+        record_property('users', scale_data['users'])
+        record_property('search_p95_ms', round(p95 * 1e3, 1))
+
+    @pytest.mark.anyio
+    async def test_feed_paging(self, async_session, scale_data, record_property):
+        after = None
+        for _ in range(100):
+            tweets = await tweet_repo.get_tweets(async_session, page=None, limit=20, after=after)
+            if len(tweets) < 20:
+                break
+            after = (tweets[-1].created_at, tweets[-1].guid)
+        first_p95 = await self.get_p95(lambda: tweet_repo.get_tweets(async_session, page=None, limit=20))
+        deep_p95 = await self.get_p95(lambda: tweet_repo.get_tweets(async_session, page=None, limit=20, after=after))
+        record_property('tweets', scale_data['tweets'])
+        record_property('first_page_p95_ms', round(first_p95 * 1e3, 1))
+        record_property('deep_page_p95_ms', round(deep_p95 * 1e3, 1))
+        # Keyset pages cost about the same at any depth
+        assert deep_p95 < first_p95 * 5 + 0.01
@@ -0,0 +1,40 @@
+from starlette.exceptions import HTTPException
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+class BodySizeLimitMiddleware:
+    """
+    Rejects requests to the given paths with 413 once their body exceeds the limit,
+    before the body is parsed or spooled by the app.
+    :param limits: path -> max body size in bytes
+    """
+
+    def __init__(self, app: ASGIApp, limits: dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        limit = self.limits.get(scope['path']) if scope['type'] == 'http' else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope['headers']).get(b'content-length')
+        if content_length is not None and int(content_length) > limit:
+            response = PlainTextResponse('Request body is too large', status_code=413)
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    raise HTTPException(status_code=413, detail='Request body is too large')
+            return message
+
+        await self.app(scope, limited_receive, send)
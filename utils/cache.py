@@ -0,0 +1,106 @@
+import abc
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import redis.asyncio
+
+
+class LRUCache:
+    """
+    In-process LRU cache where every entry also has its own expiration time (unix timestamp).
+    Not thread safe, meant to be used from the event loop.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, expires_at: float):
+        if self.max_size <= 0:
+            return
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def keys(self) -> list[Hashable]:
+        return list(self._data.keys())
+
+    def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class CacheBackend(abc.ABC):
+    """
+    Async key-value cache of serialized values
+    """
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float):
+        pass
+
+    @abc.abstractmethod
+    async def delete_prefix(self, prefix: str):
+        pass
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    Per process backend, entries are not shared between pods
+    """
+
+    def __init__(self, max_size: int):
+        self._cache = LRUCache(max_size=max_size)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self._cache.set(key, value, expires_at=time.time() + ttl)
+
+    async def delete_prefix(self, prefix: str):
+        for key in [key for key in self._cache.keys() if key.startswith(prefix)]:
+            self._cache.delete(key)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Backend shared by all pods. The size is bounded by the redis maxmemory policy,
+    which should be set to allkeys-lru for a cache-only instance.
+    """
+
+    def __init__(self, url: str):
+        self._redis = redis.asyncio.Redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._redis.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._redis.set(key, value, px=int(ttl * 1000))
+
+    async def delete_prefix(self, prefix: str):
+        keys = [key async for key in self._redis.scan_iter(match=f'{prefix}*')]
+        if keys:
+            await self._redis.unlink(*keys)
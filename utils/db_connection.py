@@ -1,18 +1,111 @@
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import time
+import uuid
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 
 from conf import settings
-from conf.secrets import db_address, db_user, db_password, db_name
+from conf.secrets import db_address, db_user, db_password, db_name, db_replica_address
 from opentelemetry.instrumentation.sqlalchemy import SQLAlchemyInstrumentor
 
+DB_POOL_WAIT_SECONDS = Histogram('db_pool_wait_seconds', 'Time spent waiting for a connection from the pool',
+                                 ['engine'])
+DB_POOL_CHECKED_OUT = Gauge('db_pool_checked_out', 'Connections currently checked out of the pool', ['engine'])
+DB_POOL_OVERFLOW = Gauge('db_pool_overflow', 'Connections open above pool_size', ['engine'])
+DB_POOL_SIZE = Gauge('db_pool_size', 'Connections kept open in the pool', ['engine'])
+DB_COMPILED_CACHE = Counter('db_compiled_cache_total',
+                            'Statements executed by whether their SQL came from the compiled statement cache',
+                            ['engine', 'result'])
+
 
 def get_connection_string(address, user, password, db_name) -> str:
     return f'postgresql+asyncpg://{user}:{password}@{address}/{db_name}'
 
 
-async_engine = create_async_engine(get_connection_string(db_address, db_user, db_password, db_name),
-                                   echo=not settings.IS_PROD)
+def get_dsn(address, user, password, db_name) -> str:
+    """
+    Connection string for asyncpg itself, without sqlalchemy
+    """
+    return f'postgresql://{user}:{password}@{address}/{db_name}'
+
+
+def track_compiled_cache(engine: AsyncEngine, name: str):
+    """
+    Counts compiled cache hits and misses of the engine. A hit also means the same SQL string
+    is sent again, so asyncpg finds the statement in its prepared statement cache.
+    """
+    results = {CACHE_HIT: 'hit', CACHE_MISS: 'miss'}
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def count_cache_result(conn, cursor, statement, parameters, context, executemany):
+        DB_COMPILED_CACHE.labels(name, results.get(context.cache_hit, 'uncached')).inc()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Default async pool that also reports how long checkouts wait for a free connection
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.labels(self.logging_name).observe(time.perf_counter() - start)
+
+
+def get_prepared_statement_name() -> str:
+    # The default __asyncpg_stmt_N__ names of different clients collide on a connection shared by the bouncer
+    return f'__asyncpg_{uuid.uuid4()}__'
+
+
+def create_engine(connection_string: str, name: str) -> AsyncEngine:
+    """
+    Creates an engine with the pool configured by settings.DB_*.
+    In bouncer mode connections are not pooled, prepared statements are not cached and get unique names,
+    as required behind a transaction pooling bouncer (pgbouncer pool_mode=transaction),
+    which hands one server connection to many clients.
+    """
+    if settings.DB_BOUNCER_MODE:
+        engine = create_async_engine(connection_string,
+                                     echo=not settings.IS_PROD,
+                                     poolclass=NullPool,
+                                     connect_args={'statement_cache_size': 0,
+                                                   'prepared_statement_cache_size': 0,
+                                                   'prepared_statement_name_func': get_prepared_statement_name})
+    else:
+        engine = create_async_engine(connection_string,
+                                     echo=not settings.IS_PROD,
+                                     poolclass=InstrumentedQueuePool,
+                                     pool_logging_name=name,
+                                     pool_size=settings.DB_POOL_SIZE,
+                                     max_overflow=settings.DB_MAX_OVERFLOW,
+                                     pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+                                     pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+                                     pool_pre_ping=settings.DB_POOL_PRE_PING,
+                                     connect_args={'prepared_statement_cache_size': settings.DB_STATEMENT_CACHE_SIZE})
+        pool = engine.sync_engine.pool
+        DB_POOL_CHECKED_OUT.labels(name).set_function(pool.checkedout)
+        DB_POOL_OVERFLOW.labels(name).set_function(lambda: max(pool.overflow(), 0))
+        DB_POOL_SIZE.labels(name).set_function(pool.size)
+    track_compiled_cache(engine, name)
+    SQLAlchemyInstrumentor().instrument(
+        engine=engine.sync_engine
+    )
+    return engine
+
+
+async_engine = create_engine(get_connection_string(db_address, db_user, db_password, db_name), name='primary')
 AsyncMainSession = async_sessionmaker(async_engine)
 
-SQLAlchemyInstrumentor().instrument(
-    engine=async_engine.sync_engine
-)
+# Falls back to the primary when no replica is configured
+if db_replica_address:
+    replica_engine = create_engine(get_connection_string(db_replica_address, db_user, db_password, db_name),
+                                   name='replica')
+    AsyncReplicaSession = async_sessionmaker(replica_engine)
+else:
+    replica_engine = async_engine
+    AsyncReplicaSession = AsyncMainSession
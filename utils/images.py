@@ -0,0 +1,31 @@
+import io
+
+from PIL import Image, ImageOps
+
+FORMAT = 'WEBP'
+CONTENT_TYPE = 'image/webp'
+EXTENSION = 'webp'
+
+
+def make_derivatives(data: bytes, sizes: tuple[int, ...], quality: int = 85) -> dict[str, bytes]:
+    """
+    Decodes an image and re-encodes it once per size, fitting it into a size x size box,
+    plus a full size copy under the 'original' key. EXIF orientation is applied and metadata dropped.
+    CPU heavy, meant to be run in a worker process.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        variants = {'original': image}
+        for size in sizes:
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+            variants[str(size)] = variant
+
+        encoded = {}
+        for name, variant in variants.items():
+            buffer = io.BytesIO()
+            variant.save(buffer, FORMAT, quality=quality)
+            encoded[name] = buffer.getvalue()
+        return encoded
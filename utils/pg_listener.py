@@ -0,0 +1,117 @@
+import asyncio
+import contextlib
+import logging
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+from prometheus_client import Counter, Gauge
+
+LISTENER_SUBSCRIBERS = Gauge('pg_listener_subscribers', 'Clients subscribed to a LISTEN channel', ['channel'])
+LISTENER_EVENTS = Counter('pg_listener_events_total', 'Notifications received on a LISTEN channel', ['channel'])
+LISTENER_DROPPED = Counter('pg_listener_dropped_total',
+                           'Messages dropped because a subscriber buffer was full', ['channel'])
+
+
+class PgListener:
+    """
+    Keeps a single LISTEN connection per process and fans notifications out to all subscribers.
+    Every notification payload is passed through `transform` once, its result is put
+    into each subscriber's queue (None results are skipped).
+    A subscriber that falls more than buffer_size messages behind loses the oldest ones.
+    """
+
+    def __init__(self, dsn: str, channel: str, transform: Callable[[str], Awaitable[Optional[str]]],
+                 buffer_size: int, reconnect_delay: float = 1):
+        self.dsn = dsn
+        self.channel = channel
+        self.transform = transform
+        self.buffer_size = buffer_size
+        self.reconnect_delay = reconnect_delay
+        self._connection: Optional[asyncpg.Connection] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._subscribers: set[asyncio.Queue] = set()
+        self._payloads: Optional[asyncio.Queue] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _ensure_listening(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._connection is not None and not self._connection.is_closed():
+                return
+            if self._dispatcher is None:
+                self._payloads = asyncio.Queue()
+                self._dispatcher = asyncio.create_task(self._dispatch_forever())
+            connection = await asyncpg.connect(self.dsn)
+            await connection.add_listener(self.channel, self._on_notification)
+            connection.add_termination_listener(self._on_termination)
+            self._connection = connection
+            self._logger.info(f"Listening on {self.channel}")
+
+    def _on_notification(self, connection, pid, channel, payload):
+        LISTENER_EVENTS.labels(self.channel).inc()
+        self._payloads.put_nowait(payload)
+
+    def _on_termination(self, connection):
+        self._logger.warning(f"Connection listening on {self.channel} was closed")
+        self._connection = None
+        if self._subscribers:
+            self._spawn(self._reconnect())
+
+    async def _reconnect(self):
+        while self._subscribers:
+            try:
+                await self._ensure_listening()
+                return
+            except (OSError, asyncpg.PostgresError) as e:
+                self._logger.warning(f"Failed to listen on {self.channel}: {e}")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _dispatch_forever(self):
+        """
+        Handles notifications one at a time, so subscribers get them in commit order
+        """
+        while True:
+            payload = await self._payloads.get()
+            try:
+                message = await self.transform(payload)
+            except Exception:
+                self._logger.exception(f"Failed to handle notification {payload}")
+                continue
+            if message is None:
+                continue
+            for queue in self._subscribers:
+                if queue.full():
+                    queue.get_nowait()
+                    LISTENER_DROPPED.labels(self.channel).inc()
+                queue.put_nowait(message)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self):
+        """
+        Yields a queue receiving messages published after this call returns
+        """
+        await self._ensure_listening()
+        queue = asyncio.Queue(maxsize=self.buffer_size)
+        self._subscribers.add(queue)
+        LISTENER_SUBSCRIBERS.labels(self.channel).inc()
+        try:
+            yield queue
+        finally:
+            self._subscribers.discard(queue)
+            LISTENER_SUBSCRIBERS.labels(self.channel).dec()
+
+    async def close(self):
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            await connection.close()
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
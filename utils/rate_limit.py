@@ -0,0 +1,232 @@
+import abc
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Literal, Optional
+from urllib.parse import parse_qs
+
+import redis.asyncio
+from prometheus_client import Counter
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+RATE_LIMIT_REQUESTS = Counter('rate_limit_requests_total', 'Requests checked against a rate limit policy',
+                              ['policy', 'result'])
+
+# Bodies are read to find the email only up to this size, larger ones are limited by ip instead
+MAX_KEY_BODY_SIZE = 2 ** 14
+
+
+class RatePolicy:
+    """
+    Token bucket per key: `burst` requests at once, refilled at `per_minute` requests a minute.
+    :param key: what requests are counted by, ip of the client, guid of the user from the bearer token
+    or `field` of the form or json body (e.g. the email)
+    """
+
+    def __init__(self, name: str, per_minute: float, burst: int, key: Literal['ip', 'user', 'body'] = 'ip',
+                 field: Optional[str] = None, methods: tuple[str, ...] = ('POST',)):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.key = key
+        self.field = field
+        self.methods = methods
+
+
+class TokenBucketBackend(abc.ABC):
+
+    @abc.abstractmethod
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        """
+        Takes a token from the bucket of key
+        :return: 0 if there was one, otherwise seconds until there is
+        """
+        pass
+
+    @abc.abstractmethod
+    async def clear(self):
+        pass
+
+
+def take_token(tokens: float, updated_at: float, now: float, rate: float, burst: int) -> tuple[float, float]:
+    """
+    :return: tokens left and seconds to wait, 0 if a token was taken
+    """
+    tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+class InMemoryTokenBuckets(TokenBucketBackend):
+    """
+    Per process buckets, a client spread over N pods gets up to N times the limit.
+    Keys are split into shards, each keeping at most max_keys // shards least recently used buckets,
+    so memory stays bounded and evicting is cheap however many clients show up.
+    """
+
+    def __init__(self, shards: int, max_keys: int):
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        self._shards: list[OrderedDict[str, tuple[float, float]]] = [OrderedDict() for _ in range(shards)]
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        tokens, updated_at = shard.get(key, (burst, now))
+        tokens, wait = take_token(tokens, updated_at, now, rate, burst)
+        shard[key] = (tokens, now)
+        shard.move_to_end(key)
+        if len(shard) > self.max_keys_per_shard:
+            shard.popitem(last=False)
+        return wait
+
+    async def clear(self):
+        for shard in self._shards:
+            shard.clear()
+
+
+class RedisTokenBuckets(TokenBucketBackend):
+    """
+    Buckets shared by all pods, every check is one round trip running a script atomically in redis
+    """
+    SCRIPT = """
+        local rate = tonumber(ARGV[1])
+        local burst = tonumber(ARGV[2])
+        local time = redis.call('TIME')
+        local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+        local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+        local tokens = tonumber(bucket[1]) or burst
+        local updated_at = tonumber(bucket[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+        local wait = 0
+        if tokens >= 1 then
+            tokens = tokens - 1
+        else
+            wait = (1 - tokens) / rate
+        end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+        return tostring(wait)
+    """
+
+    def __init__(self, url: str, prefix: str = 'rate:'):
+        self.prefix = prefix
+        self._redis = redis.asyncio.Redis.from_url(url)
+        self._script = self._redis.register_script(self.SCRIPT)
+
+    async def acquire(self, key: str, rate: float, burst: int) -> float:
+        return float(await self._script(keys=[self.prefix + key], args=[rate, burst]))
+
+    async def clear(self):
+        keys = [key async for key in self._redis.scan_iter(match=f'{self.prefix}*')]
+        if keys:
+            await self._redis.unlink(*keys)
+
+
+class RateLimitMiddleware:
+    """
+    Answers requests over the limit of any policy of their path with 429 and Retry-After,
+    before the app reads the body, queries the database or hashes a password.
+    :param policies: path -> policies applied to it
+    :param get_user_guid: bearer token -> user guid, None or an exception if the token is not valid.
+    Requests without a valid token are limited by ip by user policies
+    """
+
+    def __init__(self, app: ASGIApp, policies: dict[str, list[RatePolicy]], backend: TokenBucketBackend,
+                 get_user_guid: Callable[[str], Optional[str]], trust_forwarded: bool = False):
+        self.app = app
+        self.policies = policies
+        self.backend = backend
+        self.get_user_guid = get_user_guid
+        self.trust_forwarded = trust_forwarded
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        policies = self.policies.get(scope['path']) if scope['type'] == 'http' else None
+        policies = [policy for policy in policies or [] if scope['method'] in policy.methods]
+        if not policies:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+        body = None
+        is_body_read = False
+        for policy in policies:
+            if policy.key == 'body' and not is_body_read:
+                body, receive = await self.read_body(receive)
+                is_body_read = True
+            key = self.get_key(policy, scope, headers, body)
+            wait = await self.backend.acquire(f'{policy.name}:{key}', policy.rate, policy.burst)
+            if wait > 0:
+                RATE_LIMIT_REQUESTS.labels(policy.name, 'limited').inc()
+                response = JSONResponse({'detail': 'Too many requests'}, status_code=429,
+                                        headers={'Retry-After': str(max(1, math.ceil(wait)))})
+                await response(scope, receive, send)
+                return
+            RATE_LIMIT_REQUESTS.labels(policy.name, 'allowed').inc()
+        await self.app(scope, receive, send)
+
+    def get_ip(self, scope: Scope, headers: dict[str, str]) -> str:
+        forwarded_for = headers.get('x-forwarded-for')
+        if self.trust_forwarded and forwarded_for:
+            # The proxy appends the address it got the request from, anything before it is up to the client
+            return forwarded_for.split(',')[-1].strip()
+        client = scope.get('client')
+        return client[0] if client else 'unknown'
+
+    def get_key(self, policy: RatePolicy, scope: Scope, headers: dict[str, str], body: Optional[bytes]) -> str:
+        if policy.key == 'user':
+            authorization = headers.get('authorization', '')
+            if authorization.lower().startswith('bearer '):
+                try:
+                    user_guid = self.get_user_guid(authorization[7:])
+                except Exception:
+                    user_guid = None
+                if user_guid is not None:
+                    return f'user:{user_guid}'
+        elif policy.key == 'body':
+            value = get_body_field(body, headers.get('content-type', ''), policy.field)
+            if value is not None:
+                return f'{policy.field}:{value.strip().lower()}'
+        return f'ip:{self.get_ip(scope, headers)}'
+
+    @staticmethod
+    async def read_body(receive: Receive) -> tuple[Optional[bytes], Receive]:
+        """
+        Reads the body up to MAX_KEY_BODY_SIZE
+        :return: the body, None if it is larger, and a receive replaying what was read to the app
+        """
+        messages: list[Message] = []
+        size = 0
+        more_body = True
+        while more_body and size <= MAX_KEY_BODY_SIZE:
+            message = await receive()
+            messages.append(message)
+            if message['type'] != 'http.request':
+                break
+            size += len(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body = b''.join(message.get('body', b'') for message in messages) if not more_body else None
+
+        async def replay_receive() -> Message:
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        return body, replay_receive
+
+
+def get_body_field(body: Optional[bytes], content_type: str, field: str) -> Optional[str]:
+    if not body:
+        return None
+    try:
+        if content_type.startswith('application/x-www-form-urlencoded'):
+            values = parse_qs(body.decode())
+            return values[field][0] if field in values else None
+        if content_type.startswith('application/json'):
+            value = json.loads(body).get(field)
+            return value if isinstance(value, str) else None
+    except (ValueError, AttributeError):
+        return None
+    return None
@@ -1,2 +1,2 @@
 
-from .base import S3Storage, S3StorageBase
+from .base import S3Storage, S3StorageBase, FileTooLarge
@@ -1,38 +1,128 @@
 import abc
+import asyncio
+import io
+import time
 
 from fastapi import UploadFile
 from minio import Minio
+from prometheus_client import Histogram
 import logging
 
+UPLOAD_BYTES = Histogram('s3_upload_bytes', 'Size of objects uploaded to s3',
+                         buckets=(2 ** 10, 2 ** 14, 2 ** 17, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26))
+UPLOAD_SECONDS = Histogram('s3_upload_seconds', 'Time spent uploading an object to s3')
+UPLOAD_THROUGHPUT = Histogram('s3_upload_throughput_bytes_per_second', 'Upload throughput to s3',
+                              buckets=(2 ** 14, 2 ** 17, 2 ** 20, 2 ** 22, 2 ** 24, 2 ** 26, 2 ** 28))
+
+
+class FileTooLarge(Exception):
+    pass
+
+
+class LimitedReader:
+    """
+    File-like wrapper that fails as soon as more than max_size bytes were read,
+    so an oversized upload is rejected before it is read to the end.
+    """
+
+    def __init__(self, file, max_size: int):
+        self._file = file
+        self.max_size = max_size
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._file.read(size)
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self.max_size:
+            raise FileTooLarge(f"File is larger than {self.max_size} bytes")
+        return chunk
+
 
 class S3StorageBase:
+    """
+    In-process stand-in for the s3 storage, keeps objects in memory
+    """
 
     def __init__(self):
         self._logger = logging.getLogger(self.__class__.__name__)
+        self.objects: dict[str, bytes] = {}
 
     @abc.abstractmethod
     def upload_file(self, path, file: UploadFile):
         self._logger.info(f"Uploading {path}")
 
+    async def upload_stream(self, path, file: UploadFile, max_size: int) -> int:
+        """
+        Uploads the file without blocking the event loop and without reading it into memory at once
+        :raises FileTooLarge: if the file is larger than max_size
+        :return: uploaded size in bytes
+        """
+        start = time.perf_counter()
+        size = await self._put_stream(path, LimitedReader(file.file, max_size), file.content_type)
+        elapsed = time.perf_counter() - start
+        UPLOAD_BYTES.observe(size)
+        UPLOAD_SECONDS.observe(elapsed)
+        if elapsed > 0:
+            UPLOAD_THROUGHPUT.observe(size / elapsed)
+        return size
+
+    async def _put_stream(self, path, reader: LimitedReader, content_type) -> int:
+        self._logger.info(f"Uploading {path}")
+        chunks = []
+        while chunk := reader.read(2 ** 16):
+            chunks.append(chunk)
+        self.objects[path] = b''.join(chunks)
+        return reader.bytes_read
+
+    async def put_bytes(self, path, data: bytes, content_type):
+        self._logger.info(f"Uploading {path}")
+        self.objects[path] = data
+
+    async def read_bytes(self, path) -> bytes:
+        return self.objects[path]
+
     def get_file_url(self, path):
         return f'https://testing.s3{path}'
 
 
 class S3Storage(S3StorageBase):
 
-    def __init__(self, endpoint, access_key, secret_key, bucket_name):
+    def __init__(self, endpoint, access_key, secret_key, bucket_name, part_size: int = 5 * 2 ** 20):
         super().__init__()
         self.endpoint = endpoint
         self.client = Minio(endpoint=endpoint,
                             access_key=access_key, secret_key=secret_key,
                             cert_check=False)
         self.bucket_name = bucket_name
+        self.part_size = part_size
 
     def upload_file(self, path, file: UploadFile):
         self.client.put_object(
             self.bucket_name, path, file.file, file.size, content_type=file.content_type
         )
 
+    async def _put_stream(self, path, reader: LimitedReader, content_type) -> int:
+        # Unknown length makes minio upload in multipart chunks of part_size,
+        # so only one part is held in memory at a time
+        await asyncio.to_thread(self.client.put_object,
+                                self.bucket_name, path, reader, length=-1, part_size=self.part_size,
+                                content_type=content_type)
+        return reader.bytes_read
+
+    async def put_bytes(self, path, data: bytes, content_type):
+        await asyncio.to_thread(self.client.put_object,
+                                self.bucket_name, path, io.BytesIO(data), len(data), content_type=content_type)
+
+    async def read_bytes(self, path) -> bytes:
+        def _read():
+            response = self.client.get_object(self.bucket_name, path)
+            try:
+                return response.read()
+            finally:
+                response.close()
+                response.release_conn()
+
+        return await asyncio.to_thread(_read)
+
     def get_file_url(self, path):
         return f'https://{self.endpoint}/{self.bucket_name}{path}'
-
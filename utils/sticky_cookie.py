@@ -0,0 +1,34 @@
+from starlette.datastructures import MutableHeaders
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class StickyCookieMiddleware:
+    """
+    Sets a cookie on the response of requests that set `state_key` in request.state, e.g. from a dependency.
+    Unlike setting it on the dependency's Response, it is kept when the endpoint returns its own Response
+    (e.g. a StreamingResponse).
+    :param cookie_params: keyword arguments of Response.set_cookie
+    """
+
+    def __init__(self, app: ASGIApp, state_key: str, cookie: str, **cookie_params):
+        self.app = app
+        self.state_key = state_key
+        cookie_response = Response()
+        cookie_response.set_cookie(cookie, **cookie_params)
+        self.set_cookie = [value.decode('latin-1') for name, value in cookie_response.raw_headers
+                           if name == b'set-cookie']
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message):
+            if message['type'] == 'http.response.start' and scope.get('state', {}).get(self.state_key):
+                headers = MutableHeaders(scope=message)
+                for value in self.set_cookie:
+                    headers.append('set-cookie', value)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
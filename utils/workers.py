@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from prometheus_client import Counter, Histogram
+
+POOL_WAIT_SECONDS = Histogram('process_pool_wait_seconds',
+                              'Time a call spent queued before a worker process picked it up',
+                              ['pool'])
+POOL_RUN_SECONDS = Histogram('process_pool_run_seconds',
+                             'Time a call spent running in a worker process',
+                             ['pool'])
+POOL_REJECTED = Counter('process_pool_rejected_total',
+                        'Calls rejected because the pool queue was full',
+                        ['pool'])
+
+
+class PoolOverloaded(Exception):
+    pass
+
+
+def _timed_call(fn, submitted_at: float, *args):
+    started_at = time.time()
+    result = fn(*args)
+    return started_at - submitted_at, time.time() - started_at, result
+
+
+class BoundedProcessPool:
+    """
+    Runs CPU bound functions in worker processes so they don't block the event loop.
+    At most `max_workers` calls run at once and at most `max_queue` more wait for a free worker,
+    any call beyond that fails immediately with PoolOverloaded.
+    `fn` must be a module level function, since it is pickled to the worker.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pending = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    @property
+    def pending(self) -> int:
+        """
+        Calls running or waiting for a worker
+        """
+        return self._pending
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Created on first use so that importing the module does not start processes
+        if self._executor is None:
+            self._logger.info(f"Starting {self.max_workers} workers for pool {self.name}")
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self._pending >= self.max_workers + self.max_queue:
+            POOL_REJECTED.labels(self.name).inc()
+            raise PoolOverloaded(f"Pool {self.name} has {self._pending} pending calls")
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            waited, ran, result = await loop.run_in_executor(self._get_executor(), _timed_call,
+                                                             fn, time.time(), *args)
+        finally:
+            self._pending -= 1
+        POOL_WAIT_SECONDS.labels(self.name).observe(waited)
+        POOL_RUN_SECONDS.labels(self.name).observe(ran)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None